@@ -116,7 +116,7 @@ success_rate_blocks = analysis.calculate_success_rate_by_block_group(df)
 plot_data.plot_success_rates_by_blocks_group(df)
 
 # Calculating mean values of individuals with and without TMS and plot
-success_rate_mean_NoPulse_Pulse_group = analysis.calculate_means_PulseNopulse(success_rate_blocks)
+success_rate_mean_NoPulse_Pulse_group = analysis.calculate_means_PulseNopulse(df)
 plot_data.plot_means_boxplot(success_rate_mean_NoPulse_Pulse_group)
 
 # """
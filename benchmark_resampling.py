@@ -0,0 +1,81 @@
+"""
+=================================================
+Resampling Benchmark
+
+Compares the two resampling methods of signal_processing.downsample_data on a synthetic
+recording:
+    'fft' - raw.resample over the whole recording.
+    'polyphase' - rational up/down resampling in chunks (resample_poly_chunked).
+Reports runtime, peak memory (NumPy allocations traced with tracemalloc, the input
+signal excluded), the error of each output against the exact signal at the new sampling
+times and the alignment of the events.
+=================================================
+"""
+import time
+import tracemalloc
+import mne
+import numpy as np
+from modules import signal_processing
+
+# Benchmark settings
+duration_s = 1800      # Length of the synthetic recording in seconds
+sfreq = 5000           # Sampling frequency of the recording (Hz)
+new_sfreq = 3000       # Target sampling frequency (Hz)
+n_channels = 2         # Number of EMG channels
+event_interval_s = 1.6 # Interval between the synthetic 'Display/D  4' markers (s)
+n_tones = 20           # Number of sinusoids (20-500 Hz) summed into each channel
+
+rng = np.random.default_rng(0)
+tone_freqs = rng.uniform(20, 500, (n_channels, n_tones))
+tone_phases = rng.uniform(0, 2 * np.pi, (n_channels, n_tones))
+
+def synthetic_signal(times):
+    """Sum of the random EMG-band tones of each channel at the given times (s), in volts."""
+    data = np.zeros((n_channels, len(times)))
+    for ch in range(n_channels):
+        for freq, phase in zip(tone_freqs[ch], tone_phases[ch]):
+            data[ch] += np.sin(2 * np.pi * freq * times + phase)
+    return data * 1e-5 / np.sqrt(n_tones)
+
+def make_raw():
+    """Create a Raw object of the synthetic signal with a marker every event_interval_s."""
+    data = synthetic_signal(np.arange(int(duration_s * sfreq)) / sfreq)
+    info = mne.create_info([f'EMG{i + 1}' for i in range(n_channels)], sfreq, ch_types='emg')
+    raw = mne.io.RawArray(data, info, verbose=False)
+    onsets = np.arange(1, duration_s - 1, event_interval_s)
+    raw.set_annotations(mne.Annotations(onsets, 0, 'Display/D  4'))
+    return raw
+
+def run_method(method):
+    """Resample a fresh synthetic recording and measure runtime and peak memory."""
+    raw = make_raw()
+    tracemalloc.start()
+    start = time.perf_counter()
+    raw_resampled = signal_processing.downsample_data(raw, new_sfreq=new_sfreq, method=method)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return raw_resampled, elapsed, peak
+
+if __name__ == '__main__':
+    mne.set_log_level('ERROR')
+    signal_mb = n_channels * duration_s * sfreq * 8 / 1024**2
+    print(f"{duration_s} s x {n_channels} channels at {sfreq} Hz ({signal_mb:.0f} MB) -> {new_sfreq} Hz")
+
+    results = {method: run_method(method) for method in ['fft', 'polyphase']}
+    for method, (_, elapsed, peak) in results.items():
+        print(f"{method:>10}: {elapsed:7.2f} s, peak memory {peak / 1024**2:8.0f} MB")
+
+    # Both methods must give the same events and the signal at the new sampling times
+    raw_fft, raw_poly = results['fft'][0], results['polyphase'][0]
+    events_fft = mne.events_from_annotations(raw_fft)[0]
+    events_poly = mne.events_from_annotations(raw_poly)[0]
+    print(f"Samples: fft {raw_fft.n_times}, polyphase {raw_poly.n_times}")
+    print(f"Event samples identical: {np.array_equal(events_fft, events_poly)}")
+
+    margin = int(new_sfreq)  # edges excluded (filter start-up and FFT wrap-around)
+    times = np.arange(margin, raw_poly.n_times - margin) / new_sfreq
+    exact = synthetic_signal(times)
+    for method, raw_resampled in [('fft', raw_fft), ('polyphase', raw_poly)]:
+        error = raw_resampled._data[:, margin:raw_poly.n_times - margin] - exact
+        print(f"{method:>10}: RMS error vs exact signal {np.sqrt(np.mean(error**2)) / np.std(exact):.2e}")
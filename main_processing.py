@@ -8,8 +8,10 @@ from modules import signal_processing
 from modules import plot_data
 from modules import export_data
 from modules import utils
+from modules import cache_data
 import numpy as np
 import mne
+import os
 import matplotlib
 matplotlib.use('TkAgg')  # install python3-pil.imagetk if required
 
@@ -22,46 +24,120 @@ STEP 0 - Importing Data and Setting Flags
 volunteer_number = 'V15'         # Change volunteer number for analysis
 bool_export = False               # Change to export data to CSV
 bool_plots = True               # Change to plot data
-exclusion_method = 'RMS'         # Choose between (outliers or RMS)
-rms_thresh = 2                   # in standard deviations. Used for both FDI and FDS exclusion criteria when exclusion_method = 'RMS'
+bool_sweep = False               # Change to compute MEP/RMS for every setting of sweep_grid (STEP 2, full mode only)
+bool_morphology = True           # Change to compute MEP latency, duration, area and peak latencies per muscle
+exclusion_method = 'RMS'         # Choose between (outliers, MAD or RMS)
+exclusion_by_block = False       # Change to compute the exclusion thresholds per block instead of over the whole session
+rms_thresh = 2                   # in standard deviations. Used for the exclusion criteria of every muscle when exclusion_method = 'RMS'
+rms_sweep_s = [0.1, 0.25, 0.5, 1]  # Baseline RMS window lengths (s) for the exclusion QC sweep, full mode only (empty to skip)
+rms_thresh_grid = np.round(np.arange(1.5, 4.05, 0.1), 1)  # RMS thresholds (SD) of the exclusion sensitivity table, exported with bool_export (empty to skip)
+bool_cache = True                # Change to reuse preprocessed signals stored on disk
+filter_mode = 'full'             # Choose between (full or event_local). event_local filters only padded segments around each D4
+event_local_rtol = 0.01          # Largest accepted deviation of event_local windows from the full-mode chain, relative to the window
+                                 # peak (line noise is fitted instead of notch filtered, resampling is polyphase; checked on 20 D4)
+artifact_blank_ms = None         # (before, after) ms around each TMS pulse blanked and interpolated before filtering, event_local only (e.g. (1, 5))
+mep_delay_ms = 10                # Delay of the MEP window after its start (time_before_stim before the D4) in ms. Shorter delays put
+                                 # the pulse artifact in the window and require artifact_blank_ms; the blanked samples are a straight line
+cache_size_gb = 20               # Size budget of the signal cache (least recently used entries are evicted)
+signal_dtype = 'float64'         # Choose between (float64 or float32) for event segments, epochs and MEP/RMS values
+dtype_rtol = 1e-3                # Largest accepted deviation of float32 MEPs from float64 (checked on the first 20 D4)
+
+# EMG channel map (muscle name: channel index in the recording). Every muscle gets its own export columns
+channel_map = {
+    'FDI': 0,
+    'FDS': 1
+}
+muscles = list(channel_map)
+channel_picks = list(channel_map.values())
+
+# Preprocessing parameters (part of the cache key). fft and polyphase/fused resampling spread the stimulus
+# artifact differently into the baseline, so RMS values and exclusions are only comparable within one setting
+preprocessing_params = {
+    'filter_chain': 'mne',       # Choose between (mne or fused). fused = the mne filters with polyphase resampling, filtered in place (~1x signal memory)
+    'resample_method': 'fft',    # Choose between (fft or polyphase) for the mne chain. polyphase = chunked, bounded memory
+    'new_sfreq': 3000,
+    'notch_freqs': 60,
+    'l_freq': 20,
+    'h_freq': 500
+}
 
-# Importing data
+# Locating data and looking it up in the cache
 fname = import_signal.find_vhdr_file(volunteer_number)
-raw = import_signal.import_brainvision_data(fname)
+cache_dir = os.path.join(os.path.dirname(os.path.dirname(fname)), 'signal_cache')
+cache_key = cache_data.signal_cache_key(fname, preprocessing_params)
+data_filtered = cache_data.load_filtered_raw(cache_dir, cache_key) if bool_cache and filter_mode == 'full' else None
+
+# Reuse the filter designs (SOS coefficients) stored by previous runs
+filter_design_file = os.path.join(cache_dir, 'filter_designs.npz')
+if bool_cache and os.path.isfile(filter_design_file):
+    signal_processing.load_filter_designs(filter_design_file)
+sfreq = preprocessing_params['new_sfreq']
+
+if artifact_blank_ms is not None and filter_mode != 'event_local':
+    raise ValueError("artifact_blank_ms is only applied with filter_mode = 'event_local'.")
 
 """
 ============================================
 STEP 1 - Signal Processing
 ============================================
 """
-## Downsampling and ploting spectral analysis
-raw = signal_processing.downsample_data(raw)
-
-## Notch filtering and ploting
-raw_notch = signal_processing.notch_filter_data(raw)
-# if bool_plots:
-#     plot_data.plot_spectrum_amplitude(raw_notch, channel_index=0, fmin=1, fmax=600)
-#     plot_data.plot_psd(raw_notch)
-
-## Bandpass filtering
-bandpass_filter = signal_processing.apply_bandpass_filter(raw_notch, l_freq=20, h_freq=500)
-data_filtered = signal_processing.create_filtered_raw_object(bandpass_filter, raw_notch.info)
-# if bool_plots:
-#     plot_data.plot_spectrum_amplitude(data_filtered, channel_index=0, fmin=1, fmax=600)
-#     plot_data.plot_psd(data_filtered)
-
-# Add annotations from the original raw data and plot filtered data
-data_filtered = utils.add_annotations_to_filtered(data_filtered, raw_notch)
-# if bool_plots:
-#     data_filtered.plot()
-
-## Verify markers
-utils.marker_verification(raw, data_filtered)
-events_from_annot, event_dict = mne.events_from_annotations(data_filtered)
+if filter_mode == 'event_local':
+    # Memory-map the recording; only the segments around D4 events are read and filtered (STEP 3 and 4)
+    eeg_data, eeg_header = import_signal.memmap_brainvision_data(fname)
+    ch_names = eeg_header['ch_names']
+
+elif data_filtered is None:
+    # Importing data
+    raw = import_signal.import_brainvision_data(fname)
+
+    if preprocessing_params['filter_chain'] == 'fused':
+        ## Resampling, notch and bandpass filtering in one pass (raw is filtered in place)
+        data_filtered = signal_processing.preprocess_raw(
+            raw, new_sfreq=preprocessing_params['new_sfreq'], notch_freqs=preprocessing_params['notch_freqs'],
+            l_freq=preprocessing_params['l_freq'], h_freq=preprocessing_params['h_freq'])
+    else:
+        ## Downsampling and ploting spectral analysis
+        raw = signal_processing.downsample_data(raw, new_sfreq=preprocessing_params['new_sfreq'],
+                                               method=preprocessing_params['resample_method'])
+
+        ## Notch filtering and ploting
+        raw_notch = signal_processing.notch_filter_data(raw, freqs=preprocessing_params['notch_freqs'])
+        # if bool_plots:
+        #     plot_data.plot_spectrum_amplitude(raw_notch, channel_index=0, fmin=1, fmax=600)
+        #     plot_data.plot_psd(raw_notch)
+
+        ## Bandpass filtering
+        bandpass_filter = signal_processing.apply_bandpass_filter(
+            raw_notch, l_freq=preprocessing_params['l_freq'], h_freq=preprocessing_params['h_freq'])
+        data_filtered = signal_processing.create_filtered_raw_object(bandpass_filter, raw_notch.info)
+        # if bool_plots:
+        #     plot_data.plot_spectrum_amplitude(data_filtered, channel_index=0, fmin=1, fmax=600)
+        #     plot_data.plot_psd(data_filtered)
+
+        # Add annotations from the original raw data and plot filtered data
+        data_filtered = utils.add_annotations_to_filtered(data_filtered, raw_notch)
+        # if bool_plots:
+        #     data_filtered.plot()
+
+    ## Verify markers
+    utils.marker_verification(raw, data_filtered)
+
+    # Store the preprocessed signal for the next runs
+    if bool_cache:
+        cache_data.save_filtered_raw(data_filtered, cache_dir, cache_key, max_bytes=int(cache_size_gb * 1024**3))
+
+if filter_mode == 'full':
+    ch_names = data_filtered.ch_names
+
+# Read events straight from the marker file (same codes as mne.events_from_annotations)
+events_from_annot, event_dict = import_signal.import_brainvision_events(fname, sfreq=sfreq)
+
+# Structured event table (sample, code and alfabet number of each event)
+events_table = utils.create_event_table(events_from_annot[:, 0], events_from_annot[:, 2])
 
 # Find the index of the 1st D4 and slice the array
-start_index = np.argmax(events_from_annot[:, 2] == 4)
-events_from_annot = events_from_annot[start_index:]
+start_index = np.argmax(events_table['code'] == 4)
+events_from_annot = events_table[start_index:]
 
 # Split events into InGame and OutGame
 events_from_annot_outGame, events_from_annot = signal_processing.split_events_InOut_game(events_from_annot)
@@ -74,26 +150,25 @@ if volunteer_number == 'V03':
                         5462.303, 5468.657, 5474.451, 5479.522, 5484.997, 5490.405, 5495.878, 5501.008]
 
     # Convert times in samples
-    sfreq = int(data_filtered.info["sfreq"])
     marker_rest_samples = [int(x * sfreq) for x in marker_times_sec]
 
-    # Create an array with 3 columns and marker_rest_samples as the first column
-    events_from_annot_outGame = np.array([marker_rest_samples, [0] * len(marker_rest_samples), [0] * len(marker_rest_samples)]).T
+    # Create an event table with marker_rest_samples as samples
+    events_from_annot_outGame = utils.create_event_table(marker_rest_samples, np.zeros(len(marker_rest_samples)))
 
 # To view annotations
 # if bool_plots:
-#     mne.viz.plot_events(events_from_annot, sfreq=data_filtered.info['sfreq'], event_id=event_dict)
+#     mne.viz.plot_events(events_from_annot, sfreq=sfreq, event_id=event_dict)
 
 """
 ====================================================
 STEP 2 - Seting General Parameters
 ====================================================
 """
-# Create the trigger array
-trigger = signal_processing.create_trigger_array(data_filtered)
+# Create the (sparse) trigger at all D4 events; use signal_processing.trigger_to_dense for a dense range
+trigger = signal_processing.create_trigger_array(
+    events_table['sample'][events_table['code'] == 4], n_times=data_filtered.n_times if filter_mode == 'full' else None)
 
-# Get sampling frequency and set timing variables
-sfreq = int(data_filtered.info["sfreq"])
+# Set timing variables
 time_before_stim = 0.01  # s
 time_after_stim = 0.06  # s
 time_before_rms = 0.5  # s
@@ -103,6 +178,18 @@ samples_before_stim = int(time_before_stim * sfreq)
 samples_after_stim = int(time_after_stim * sfreq)
 samples_before_rms = int(time_before_rms * sfreq)
 
+if mep_delay_ms < 1000 * time_before_stim and artifact_blank_ms is None:
+    raise ValueError("mep_delay_ms shorter than time_before_stim puts the TMS pulse artifact in the MEP window; "
+                     "set artifact_blank_ms (event_local mode).")
+
+# Grid of MEP/RMS window settings for the parameter sweep (bool_sweep)
+sweep_grid = {
+    'time_before_stim': [0.005, 0.01, 0.02],  # s
+    'time_after_stim': [0.04, 0.06, 0.08],    # s
+    'time_before_rms': [0.25, 0.5, 1],        # s
+    'delay_ms': [5, 10, 15]                   # ms, delay of the peak-to-peak window
+}
+
 # Conversion of code names ('Gkg/G 2', 'Gkg/G 4' and 'Gkg/G 8') to alfabet numbers (0, 1 and 2)
 alfabet = {
     'Gkg/G  2': 0,
@@ -115,35 +202,47 @@ alfabet = {
 STEP 3 - Event Analysis
 ============================================
 """
-# Extract events from annotations based on event_id
-events_from_annot_D1 = utils.extract_events_from_annot(events_from_annot, 1)
-events_from_annot_D2 = utils.extract_events_from_annot(events_from_annot, 2)
-events_from_annot_G2 = utils.extract_events_from_annot(events_from_annot, 6)
-events_from_annot_G4 = utils.extract_events_from_annot(events_from_annot, 7)
-events_from_annot_G8 = utils.extract_events_from_annot(events_from_annot, 8)
-events_from_annot_D4 = utils.extract_events_from_annot(events_from_annot, 4)
+# Set alfabet numbers and split events by event_id in one pass
+utils.set_event_alfabet(events_from_annot, event_dict, alfabet)
+event_parts = utils.partition_events_by_code(events_from_annot)
 
-# Combine Gkg events G2, G4 and G8
-events_Gkg = utils.combine_gkg_events(events_from_annot_G2, events_from_annot_G4, events_from_annot_G8)
+# Extract events based on event_id (G2, G4 and G8 combined in time order as Gkg events)
+events_from_annot_D2 = event_parts[2]
+events_from_annot_D4 = event_parts[4]
+events_Gkg = utils.select_events(event_parts, [6, 7, 8])
 
 # Calculate response times - Using D2 marker (arrows appearance)
+# sequence (Gx1) and choice (Gx2) are given as alfabet numbers (NaN where no Gkg event follows the D2)
 response_times, sequence, choice = signal_processing.calculate_response_times(
-    events_from_annot_D2, events_Gkg, data_filtered)
-
-# Get sequence and choice
-sequence = utils.convert_to_alfabet(sequence, alfabet)  # convert Gx1 (sequence) to alfabet numbers
-choice = utils.convert_to_alfabet(choice, alfabet)      # convert Gx2 (choice) to alfabet numbers
+    events_from_annot_D2, events_Gkg, sfreq)
 
 # Analyse choices
 result = signal_processing.analyze_choice(choice, sequence)
 
 # Get D4 out game events
-events_D4_outGame = events_from_annot_outGame[:, 0]
-
-# Process event windows and get MEP out game
-MEPpp_FDI_outGame_V, MEPpp_FDS_outGame_V, _, _ = signal_processing.get_event_data_windows(
-    data_filtered, events_D4_outGame, samples_before_stim, samples_after_stim, samples_before_rms
-)
+events_D4_outGame = events_from_annot_outGame['sample']
+
+# Filter parameters for event_local mode
+segment_filter_params = {key: preprocessing_params[key] for key in ['new_sfreq', 'notch_freqs', 'l_freq', 'h_freq']}
+segment_filter_params['blank_ms'] = artifact_blank_ms
+if artifact_blank_ms is not None:
+    # Blank at the native samples of the TMS pulses (D4 markers and, for V03, the rest markers)
+    marker_samples, marker_names = import_signal.read_brainvision_markers(fname)
+    stimulus_samples = marker_samples[marker_names == 'Display/D  4']
+    if volunteer_number == 'V03':
+        stimulus_samples = np.union1d(stimulus_samples, np.round(np.array(marker_times_sec) * eeg_header['sfreq']))
+    segment_filter_params['stimulus_samples'] = stimulus_samples.astype(np.int64)
+
+# Build out game epochs (from the RMS window start to the end of the MEP window) and get MEP out game
+if filter_mode == 'event_local':
+    epochs_outGame = signal_processing.filter_event_segments(
+        eeg_data, eeg_header['sfreq'], events_D4_outGame, samples_before_rms, samples_after_stim,
+        scales=eeg_header['scales'], dtype=signal_dtype, **segment_filter_params)
+else:
+    epochs_outGame = signal_processing.extract_epochs(
+        data_filtered._data, events_D4_outGame, samples_before_rms, samples_after_stim, dtype=signal_dtype)
+MEPpp_outGame_V, _ = signal_processing.get_epoch_metrics(
+    epochs_outGame[:, channel_picks], samples_before_stim, samples_before_rms, delay_ms=mep_delay_ms, sfreq=sfreq)
 
 """
 =============================
@@ -151,37 +250,77 @@ STEP 4 - MEP and RMS Analysis
 =============================
 """
 # Detect events 'Display/D 4' for Trigger
-events_D4 = events_from_annot_D4[:, 0]
+events_D4 = events_from_annot_D4['sample']
 
 # To cut an extra D4 marker in V03
 if volunteer_number == 'V03':
     events_D4 = events_D4[events_D4 != 3691471]
 
-# Create figure for plotting
-f, ax1, ax2 = plot_data.create_figure("Raw MEP amplitudes")
-
-# Create x-axis (time) values
-x = np.arange(-time_before_stim, time_after_stim, 1/sfreq)
-
-# Process event windows and get MEP and RMS
-MEPpp_FDI_V, MEPpp_FDS_V, rmsAmplitude_FDI_V, rmsAmplitude_FDS_V = signal_processing.get_event_data_windows(
-    data_filtered, events_D4, samples_before_stim, samples_after_stim, samples_before_rms
-)
-
-# Plot the extracted data
-for i in range(len(events_D4)):
-    win_1 = data_filtered._data[0][events_D4[i] - samples_before_stim : events_D4[i] + samples_after_stim]
-    win_2 = data_filtered._data[1][events_D4[i] - samples_before_stim : events_D4[i] + samples_after_stim]
-    plot_data.plot_emg_data(x, data_filtered, win_1, win_2, ax1, ax2)
-
-# Configure and display the plot of MEPs overlayed for FDI and FDS
+# Build epochs (from the RMS window start to the end of the MEP window)
+if filter_mode == 'event_local':
+    # Check the windows against the full-mode chain on the first 20 D4 (raises if above tolerance)
+    signal_processing.validate_event_local(
+        eeg_data, eeg_header['sfreq'], events_D4, samples_before_rms, samples_after_stim, rtol=event_local_rtol,
+        resample_method=preprocessing_params['resample_method'] if preprocessing_params['filter_chain'] == 'mne' else 'polyphase',
+        scales=eeg_header['scales'], dtype=signal_dtype, **segment_filter_params)
+
+    epochs = signal_processing.filter_event_segments(
+        eeg_data, eeg_header['sfreq'], events_D4, samples_before_rms, samples_after_stim,
+        scales=eeg_header['scales'], dtype=signal_dtype, **segment_filter_params)
+else:
+    epochs = signal_processing.extract_epochs(
+        data_filtered._data, events_D4, samples_before_rms, samples_after_stim, dtype=signal_dtype)
+
+# Check reduced-precision MEPs against the float64 path on the first 20 D4 (raises if above tolerance)
+if signal_dtype != 'float64':
+    if filter_mode == 'event_local':
+        reference_epochs = signal_processing.filter_event_segments(
+            eeg_data, eeg_header['sfreq'], events_D4[:20], samples_before_rms, samples_after_stim,
+            scales=eeg_header['scales'], **segment_filter_params)
+    else:
+        reference_epochs = signal_processing.extract_epochs(
+            data_filtered._data, events_D4[:20], samples_before_rms, samples_after_stim)
+    signal_processing.validate_epoch_dtype(
+        epochs[:20], reference_epochs, samples_before_stim, samples_before_rms, rtol=dtype_rtol,
+        delay_ms=mep_delay_ms, sfreq=sfreq)
+
+# Keep the channels of the channel map (in map order)
+epochs = epochs[:, channel_picks]
+emg_ch_names = [ch_names[pick] for pick in channel_picks]
+
+# Store the filter designs used so far for the next runs
+if bool_cache:
+    os.makedirs(cache_dir, exist_ok=True)
+    signal_processing.save_filter_designs(filter_design_file)
+
+# Process event windows and get MEP and RMS, shaped (n_events, n_muscles)
+MEPpp_V, rmsAmplitude_V = signal_processing.get_epoch_metrics(
+    epochs, samples_before_stim, samples_before_rms, delay_ms=mep_delay_ms, sfreq=sfreq)
+
+# MEP morphology (every metric of signal_processing.MEP_METRICS), each shaped (n_events, n_muscles)
+if bool_morphology:
+    mep_morphology = signal_processing.compute_mep_metrics(
+        epochs, sfreq, samples_before_stim, samples_before_rms, delay_ms=mep_delay_ms)
+
+# MEP and RMS for every setting of sweep_grid, from one superset extraction (tidy table)
+if bool_sweep and filter_mode == 'full':
+    df_sweep = signal_processing.sweep_epoch_metrics(
+        data_filtered._data, events_D4, sfreq, picks=channel_picks, ch_names=muscles, n_jobs=os.cpu_count(),
+        **sweep_grid)
+
+# Plot the MEP windows of the epochs overlayed, one subplot per muscle
 if bool_plots:
-    plot_data.configure_plot(data_filtered, ax1, ax2)
+    f, *axes = plot_data.create_figure("Raw MEP amplitudes", n_axes=len(muscles))
+    x = np.arange(-samples_before_stim, samples_after_stim) / sfreq
+    mep_windows = epochs[:, :, samples_before_rms - samples_before_stim:]
+    plot_data.plot_emg_data(x, mep_windows, axes)
+    plot_data.configure_plot(emg_ch_names, axes)
 
-# Correction valid for V09 because of invalid MEPs
+# Correction valid for V09 because of invalid MEPs (minimum MEP in µV per muscle)
 if volunteer_number == 'V09':
-    MEPpp_FDI_V[MEPpp_FDI_V < (60 / 1000000)] = np.nan
-    MEPpp_FDS_V[MEPpp_FDS_V < (100 / 1000000)] = np.nan
+    min_mep_V09 = {'FDI': 60, 'FDS': 100}
+    min_mep_V = np.array([min_mep_V09.get(muscle, 0) for muscle in muscles]) / 1000000
+    MEPpp_V[MEPpp_V < min_mep_V] = np.nan
     
 """
 ============================================
@@ -196,8 +335,6 @@ day_info = np.full(len(play_info), 1)
 step_info = np.full(len(play_info), 1)
 tree_info = np.full(len(play_info), 13)
 ID_info = np.full(len(play_info),vol_number)
-relMean_MEPpp_FDI = np.full(len(play_info), 0)
-relMean_MEPpp_FDS = np.full(len(play_info), 0)
 block_info = np.concatenate((
     np.full(11, 0),   
     np.full(199, 1),    
@@ -213,62 +350,68 @@ block_info = np.concatenate((
 STEP 6 - MEP normalization and Outliers exclusion
 =================================================
 """
+# Exclusion thresholds per block or over the whole session
+exclusion_groups = block_info if exclusion_by_block else None
+
 if exclusion_method == 'RMS':
-    # Analyze RMS amplitudes
-    rms_mean_FDI = np.mean(rmsAmplitude_FDI_V)
-    rms_mean_FDS = np.mean(rmsAmplitude_FDS_V)
-    rms_std_FDI = np.std(rmsAmplitude_FDI_V)
-    rms_std_FDS = np.std(rmsAmplitude_FDS_V)
-
-    # Set RMS thresholds for exclusion
-    rms_threshold_FDI = rms_mean_FDI + (rms_thresh * rms_std_FDI)
-    rms_threshold_FDS = rms_mean_FDS + (rms_thresh * rms_std_FDS)    
+    # Set RMS thresholds for exclusion (one per muscle and block, repeated on every event)
+    rms_exclusion = signal_processing.exclude_outliers(rmsAmplitude_V, 'rms_sd', groups=exclusion_groups, k=rms_thresh)
+    rms_thresholds = rms_exclusion['upper'][rms_exclusion['codes']]
     
     # Get RMS time points
-    rms_time_points = data_filtered.times[events_D4]
+    rms_time_points = events_D4 / sfreq
 
     # Plot RMS amplitudes over time
     if bool_plots:
-        plot_data.plot_rms_amplitudes(
-            rms_time_points, rmsAmplitude_FDI_V, rmsAmplitude_FDS_V, rms_threshold_FDI, rms_threshold_FDS,
-            data_filtered)
+        plot_data.plot_rms_amplitudes(rms_time_points, rmsAmplitude_V, rms_thresholds, emg_ch_names)
 
     # Plot MEP amplitudes over time
     if bool_plots:
-        plot_data.plot_mep_amplitudes(
-            rms_time_points, MEPpp_FDI_V, MEPpp_FDS_V, rmsAmplitude_FDI_V, rmsAmplitude_FDS_V, rms_threshold_FDI, 
-            rms_threshold_FDS, data_filtered)
+        plot_data.plot_mep_amplitudes(rms_time_points, MEPpp_V, rmsAmplitude_V, rms_thresholds, emg_ch_names)
         
-    # Apply exclusion to MEP amplitudes based on RMS (gives NaN if excluded)
-    MEPpp_FDI_withExclusions_V = signal_processing.exclude_mep_rms(MEPpp_FDI_V.copy(), rmsAmplitude_FDI_V, rms_threshold_FDI)
-    MEPpp_FDS_withExclusions_V = signal_processing.exclude_mep_rms(MEPpp_FDS_V.copy(), rmsAmplitude_FDS_V, rms_threshold_FDS)
-
-if exclusion_method == 'outliers':     
-    # Apply exclusion based on IQR (return NaN if excluded)
-    MEPpp_FDI_withExclusions_V = signal_processing.remove_outliers_by_index(MEPpp_FDI_V, block_info)
-    MEPpp_FDS_withExclusions_V = signal_processing.remove_outliers_by_index(MEPpp_FDS_V, block_info)
+    # QC: excluded fraction per baseline window length, from a sum-of-squares index (O(1) per window)
+    if rms_sweep_s and filter_mode == 'full':
+        rms_index = signal_processing.build_rms_index(data_filtered._data, channel_picks)
+        sweep_lengths = (np.asarray(rms_sweep_s) * sfreq).astype(int)
+        excluded_fraction = signal_processing.rms_exclusion_sweep(
+            rms_index, events_D4, sweep_lengths, rms_thresh, groups=exclusion_groups)
+        for window_s, fractions in zip(rms_sweep_s, excluded_fraction):
+            print(f"RMS window {window_s} s excludes " + ", ".join(
+                f"{muscle} {fraction:.1%}" for muscle, fraction in zip(muscles, fractions)))
+
+    exclusion_mask = rms_exclusion['mask']
+
+if exclusion_method in ['outliers', 'MAD']:
+    # Outlier MEPs of the pulse blocks (2, 4 and 6) by IQR or robust z-score
+    mep_exclusion = signal_processing.exclude_outliers(
+        MEPpp_V, 'iqr' if exclusion_method == 'outliers' else 'mad', groups=exclusion_groups,
+        reference=np.isin(block_info, [2, 4, 6]))
+    exclusion_mask = mep_exclusion['mask']
+
+# Apply exclusion to MEP amplitudes (gives NaN if excluded)
+MEPpp_withExclusions_V = np.where(exclusion_mask, np.nan, MEPpp_V)
 
 # Convert from V to mV
-MEPpp_FDI_withExclusions_µV = MEPpp_FDI_withExclusions_V * 1e6
-MEPpp_FDS_withExclusions_µV = MEPpp_FDS_withExclusions_V * 1e6
-MEPpp_FDI_outGame_µV = MEPpp_FDI_outGame_V * 1e6
-MEPpp_FDS_outGame_µV = MEPpp_FDS_outGame_V * 1e6
+MEPpp_withExclusions_µV = MEPpp_withExclusions_V * 1e6
+MEPpp_outGame_µV = MEPpp_outGame_V * 1e6
 
-# Mean of MEPs out game
-MEP_mean_FDI_outGame_µV = np.mean(MEPpp_FDI_outGame_µV)
-MEP_mean_FDS_outGame_µV = np.mean(MEPpp_FDS_outGame_µV)
+# Mean of MEPs out game (one per muscle)
+MEP_mean_outGame_µV = np.mean(MEPpp_outGame_µV, axis=0)
 
-# Array of MEP Mean out game to be included on data frame
-FDImep_outGame = np.full(len(play_info), MEP_mean_FDI_outGame_µV)
-FDSmep_outGame = np.full(len(play_info), MEP_mean_FDS_outGame_µV)
+# MEP Mean out game repeated on every play, to be included on data frame
+mep_outGame = np.tile(MEP_mean_outGame_µV, (len(play_info), 1))
 
 # MEP normalization by rest
-relRest_MEPpp_FDI = MEPpp_FDI_withExclusions_µV / MEP_mean_FDI_outGame_µV
-relRest_MEPpp_FDS = MEPpp_FDS_withExclusions_µV / MEP_mean_FDS_outGame_µV
+relRest_MEPpp = MEPpp_withExclusions_µV / MEP_mean_outGame_µV
 
 # MEP normalization by mean
-relMean_MEPpp_FDI = signal_processing.normalize_mep_by_mean(MEPpp_FDI_withExclusions_µV, block_info)
-relMean_MEPpp_FDS = signal_processing.normalize_mep_by_mean(MEPpp_FDS_withExclusions_µV, block_info)
+relMean_MEPpp = signal_processing.normalize_mep_by_mean(MEPpp_withExclusions_µV, block_info)
+
+# QC: exclusion counts and normalized MEP means per block for every threshold of rms_thresh_grid
+if exclusion_method == 'RMS' and len(rms_thresh_grid):
+    rms_sensitivity = signal_processing.rms_threshold_sensitivity(
+        MEPpp_V * 1e6, rmsAmplitude_V, rms_thresh_grid, block_info, groups=exclusion_groups,
+        rest_mean=MEP_mean_outGame_µV)
 
 """
 ============================================
@@ -284,17 +427,13 @@ variables_to_export_gklab = {
     'tree_info': tree_info,
     'ID_info': ID_info,
     'response_time_info': response_times,
-    'response_info': choice,
-    'stochastic_chain_info': sequence,
-    'MEPpp_FDI_µV': MEPpp_FDI_withExclusions_µV,
-    'MEPpp_FDS_µV': MEPpp_FDS_withExclusions_µV,
-    'relRest_MEPpp_FDI': relRest_MEPpp_FDI,
-    'relRest_MEPpp_FDS': relRest_MEPpp_FDS,
-    'relMean_MEPpp_FDI': relMean_MEPpp_FDI,
-    'relMean_MEPpp_FDS': relMean_MEPpp_FDS,
+    'response_info': export_data.nullable_integer_column(choice),
+    'stochastic_chain_info': export_data.nullable_integer_column(sequence),
+    **export_data.channel_columns('MEPpp_{}_µV', MEPpp_withExclusions_µV, muscles),
+    **export_data.channel_columns('relRest_MEPpp_{}', relRest_MEPpp, muscles),
+    **export_data.channel_columns('relMean_MEPpp_{}', relMean_MEPpp, muscles),
     'block_info': block_info,
-    'FDImep_outGame': FDImep_outGame,
-    'FDSmep_outGame': FDSmep_outGame   
+    **export_data.channel_columns('{}mep_outGame', mep_outGame, muscles)
 }                                   
 
 # # Deal with NaN values filling with symbolic value (receive 99999)
@@ -312,4 +451,15 @@ csv_path = os.path.join(dir_path, csv_filename)
 
 # Export the DataFrames if export flag is True
 if bool_export:
-    export_data.export_to_GKlab_csv(df_gklab, csv_path)
\ No newline at end of file
+    export_data.export_to_GKlab_csv(df_gklab, csv_path)
+    if bool_sweep and filter_mode == 'full':
+        export_data.export_to_csv(df_sweep, os.path.join(dir_path, 'df_' + volunteer_number + '_sweep.csv'))
+    if exclusion_method == 'RMS' and len(rms_thresh_grid):
+        df_rms_sensitivity = export_data.sensitivity_to_df(rms_sensitivity, muscles)
+        export_data.export_to_csv(df_rms_sensitivity, os.path.join(dir_path, 'df_' + volunteer_number + '_rms_sensitivity.csv'))
+    if bool_morphology:
+        morphology_columns = {}
+        for metric, values in mep_morphology.items():
+            morphology_columns.update(export_data.channel_columns(metric + '_{}', values, muscles))
+        df_morphology = export_data.create_df_from_dict({'play_info': play_info, **morphology_columns})
+        export_data.export_to_csv(df_morphology, os.path.join(dir_path, 'df_' + volunteer_number + '_morphology.csv'))
\ No newline at end of file
@@ -2,7 +2,83 @@ import pandas as pd
 import numpy as np
 
 
-def calculate_global_success_rate_group(df):
+def _is_correct(df):
+    """Whether each response_info equals its stochastic_chain_info; False where either is missing."""
+    response, chain = df['response_info'], df['stochastic_chain_info']
+    return (response.notna() & chain.notna() & response.eq(chain).fillna(False)).to_numpy(dtype=bool)
+
+def build_success_rate_cube(df, by=('ID_info', 'block_info', 'tms_pulse', 'context'), exclude_first_last=0):
+    """
+    Count the trials and correct responses of every cell of volunteer x block x pulse 
+    condition x context with a single groupby().agg.
+
+    Correctness ('response_info' == 'stochastic_chain_info', never for a missing response 
+    or chain entry) is computed once. The 'tms_pulse' (as utils.categorize_tms_pulse) and 
+    'context' (as create_context_column) columns are derived when the DataFrame does not 
+    have them. Cells with a missing label 
+    (e.g. no context or block 0 without pulse condition) are kept. Coarser success rates 
+    follow from the cube with rollup_success_rates.
+
+    Parameters:
+    df (pd.DataFrame): Trial table with 'ID_info', 'block_info', 'response_info' and 
+                       'stochastic_chain_info' (one or many volunteers).
+    by (tuple, optional): Columns of the cube. Default is ('ID_info', 'block_info', 
+                          'tms_pulse', 'context').
+    exclude_first_last (int, optional): Number of trials left out at the beginning and end 
+                                        of each volunteer's data. Default is 0.
+
+    Returns:
+    pd.DataFrame: One row per cell with the by columns, 'n_trials', 'n_correct' and 'success_rate'.
+    """
+    columns = {}
+    for column in by:
+        if column in df.columns:
+            columns[column] = df[column].to_numpy()
+        elif column == 'tms_pulse':
+            block = df['block_info'].to_numpy()
+            columns[column] = np.select([np.isin(block, [2, 4, 6]), np.isin(block, [1, 3, 5])], 
+                                        ['Pulse', 'noPulse'], None)
+        elif column == 'context':
+            columns[column] = create_context_column(df[['ID_info', 'block_info', 'stochastic_chain_info']].copy())['context'].to_numpy()
+        else:
+            raise KeyError(column)
+    trials = pd.DataFrame(columns)
+    trials['correct'] = _is_correct(df)
+
+    if exclude_first_last:
+        # Position of each trial from the beginning and the end of its volunteer's data
+        volunteer = df['ID_info'].reset_index(drop=True)
+        from_start = volunteer.groupby(volunteer).cumcount()
+        from_end = volunteer.groupby(volunteer).cumcount(ascending=False)
+        trials = trials[((from_start >= exclude_first_last) & (from_end >= exclude_first_last)).to_numpy()]
+
+    cube = trials.groupby(list(by), dropna=False)['correct'].agg(n_trials='size', n_correct='sum').reset_index()
+    cube['success_rate'] = cube['n_correct'] / cube['n_trials']
+    return cube
+
+def rollup_success_rates(cube, by):
+    """
+    Aggregate the success-rate cube to coarser groups.
+
+    As correctness is 0 or 1, the mean and (sample) standard deviation of each group 
+    follow from its numbers of trials n and correct responses k: k / n and 
+    sqrt((k - k**2 / n) / (n - 1)).
+
+    Parameters:
+    cube (pd.DataFrame): Result of build_success_rate_cube.
+    by (list): Columns of the cube to group by, e.g. ['ID_info'] or ['ID_info', 'block_info'].
+
+    Returns:
+    pd.DataFrame: One row per group with the by columns, 'n_trials', 'n_correct', 
+                  'success_rate' and 'std'.
+    """
+    rates = cube.groupby(list(by), dropna=False)[['n_trials', 'n_correct']].sum().reset_index()
+    n_trials, n_correct = rates['n_trials'], rates['n_correct']
+    rates['success_rate'] = n_correct / n_trials
+    rates['std'] = np.sqrt((n_correct - n_correct**2 / n_trials) / (n_trials - 1))
+    return rates
+
+def calculate_global_success_rate_group(df, cube=None):
     """
     Calculate the mean and standard deviation of success rates for each group defined by 'ID_info'.
 
@@ -15,58 +91,42 @@ def calculate_global_success_rate_group(df):
         - 'ID_info': Identifier for grouping the data.
         - 'response_info': The responses given by participants.
         - 'stochastic_chain_info': The correct responses against which 'response_info' is compared.
+    cube (pd.DataFrame, optional): Success-rate cube of df (build_success_rate_cube), built if not given.
 
     Returns:
     tuple: A tuple containing:
         - means (list): A list of mean success rates for each unique ID in 'ID_info'.
         - stds (list): A list of SD of success rates for each unique ID in 'ID_info'.
     """
+    if cube is None:
+        cube = build_success_rate_cube(df, by=('ID_info',))
+    rates = rollup_success_rates(cube, ['ID_info'])
+    return rates['success_rate'].tolist(), rates['std'].tolist()
 
-    # Group by 'ID_info' and calculate mean and std for each group
-    grouped = df.groupby('ID_info').apply(
-        lambda group: pd.Series({
-            'mean': (group['response_info'] == group['stochastic_chain_info']).mean(),
-            'std': (group['response_info'] == group['stochastic_chain_info']).std()
-        })
-    )
-
-    # Extract results as lists
-    means = grouped['mean'].tolist()
-    stds = grouped['std'].tolist()
-
-    return means, stds
-
-def calculate_means_PulseNopulse(success_rate_blocks):
+def calculate_means_PulseNopulse(df, cube=None):
     """
-    Calculate mean values for each key in a nested dictionary based on specified rules.
+    Calculate the mean block success rate of each volunteer without (blocks 1, 3 and 5) and 
+    with (blocks 2, 4 and 6) TMS pulses.
 
     Parameters:
-    success_rate_blocks (dict): A nested dictionary where each key has another dictionary of values.
+    df (pd.DataFrame): A DataFrame containing 'ID_info', 'block_info', 'response_info', and 'stochastic_chain_info'.
+    cube (pd.DataFrame, optional): Success-rate cube of df (build_success_rate_cube), built if not given.
 
     Returns:
-    dict: A new dictionary with keys 'NoPulse' and 'Pulse' for each original key.
+    dict: A dictionary where keys are IDs and values are dictionaries with 'mean_NoPulse' and 
+          'mean_Pulse' (None when the volunteer has no such block).
     """
-    result = {}
-
-    # Iterate through each key in the original dictionary
-    for key, inner_dict in success_rate_blocks.items():
-        # Extract values for keys 1, 3, 5 and keys 2, 4, 6
-        values_NoPulse = [inner_dict.get(i)
-                          for i in [1, 3, 5] if i in inner_dict]
-        values_Pulse = [inner_dict.get(i)
-                        for i in [2, 4, 6] if i in inner_dict]
+    if cube is None:
+        cube = build_success_rate_cube(df, by=('ID_info', 'block_info'))
+    rates = rollup_success_rates(cube, ['ID_info', 'block_info'])
+    block = rates['block_info']
+    condition = pd.Series(np.select([block.isin([1, 3, 5]), block.isin([2, 4, 6])], 
+                                    ['mean_NoPulse', 'mean_Pulse'], None), index=rates.index)
+    means = (rates.groupby(['ID_info', condition])['success_rate'].mean().unstack()
+             .reindex(index=rates['ID_info'].unique(), columns=['mean_NoPulse', 'mean_Pulse']))
 
-        # Calculate means if there are values to calculate
-        mean_NoPulse = np.mean(values_NoPulse) if values_NoPulse else None
-        mean_Pulse = np.mean(values_Pulse) if values_Pulse else None
-
-        # Store results in the new dictionary
-        result[key] = {
-            'mean_NoPulse': mean_NoPulse,
-            'mean_Pulse': mean_Pulse
-        }
-
-    return result
+    # Missing means as None
+    return means.astype(object).where(means.notna(), None).to_dict(orient='index')
 
 
 def calculate_global_success_rate_with_exclusion_group(df, exclude_first_last=100):
@@ -81,134 +141,412 @@ def calculate_global_success_rate_with_exclusion_group(df, exclude_first_last=10
     means (list): A list of mean success rates for each ID_info.
     stds (list): A list of standard deviations for each ID_info.
     """
+    cube = build_success_rate_cube(df, by=('ID_info',), exclude_first_last=exclude_first_last)
+    rates = rollup_success_rates(cube, ['ID_info'])
+    return rates['success_rate'].tolist(), rates['std'].tolist()
 
-    # Initialize lists to store means and standard deviations
-    means = []
-    stds = []
-
-    # Group by 'ID_info'
-    grouped = df.groupby('ID_info')
-
-    for name, group in grouped:
-        # # Exclude the first and last specified number of rows for each group
-        group_trimmed = group.iloc[exclude_first_last:-exclude_first_last]
-
-        # Calculate mean and std for the trimmed group
-        mean_success_rate = (
-            group_trimmed['response_info'] == group_trimmed['stochastic_chain_info']).mean()
-        std_success_rate = (
-            group_trimmed['response_info'] == group_trimmed['stochastic_chain_info']).std()
-
-        # Append results to lists
-        means.append(mean_success_rate)
-        stds.append(std_success_rate)
-
-    return means, stds
 
-
-def calculate_success_rate_by_block_group(df):
+def calculate_success_rate_by_block_group(df, cube=None):
     """
     Calculate success rates for each unique block in 'block_info', grouped by 'ID_info'.
 
     Parameters:
     df (pd.DataFrame): A DataFrame containing 'ID_info', 'block_info', 'response_info', and 'stochastic_chain_info'.
+    cube (pd.DataFrame, optional): Success-rate cube of df (build_success_rate_cube), built if not given.
 
     Returns:
     dict: A dictionary where keys are IDs and values are dictionaries with block numbers as keys and their corresponding success rates as values.
     """
-    # Initialize a dictionary to store results
-    results = {}
-
-    # Group by 'ID_info'
-    for id_value, group in df.groupby('ID_info'):
-        # For each ID, calculate success rates for each block
-        success_rates = group.groupby('block_info').apply(
-            lambda block: (block['response_info'] ==
-                           block['stochastic_chain_info']).mean()
-        ).to_dict()
-
-        # Store the results in the dictionary
-        results[id_value] = success_rates
-
-    return results
+    if cube is None:
+        cube = build_success_rate_cube(df, by=('ID_info', 'block_info'))
+    rates = rollup_success_rates(cube, ['ID_info', 'block_info'])
+    table = rates.pivot(index='block_info', columns='ID_info', values='success_rate')
+    return {id_value: column.dropna().to_dict() for id_value, column in table.items()}
 
 # Using
-def create_last_error(df):
+def create_last_error(df, group_column='ID_info'):
     """
     This function updates the 'last_was_error' column in the DataFrame based on the
     conditions specified regarding 'stochastic_chain_info' and 'result' columns.
+
+    A trial answered ('correct' or 'incorrect' result) right after a trial with 
+    stochastic_chain_info == 1 labels the next three trials with 0 (correct) or 1 
+    (incorrect); a later such trial overwrites the labels of an earlier one. The labels 
+    are computed with shifted boolean masks and a running maximum of the labelling 
+    trial, so the whole multi-volunteer table is processed in one call. Labels never 
+    cross into the next volunteer or past the last row.
     
     Parameters:
-    df (pd.DataFrame): The DataFrame containing the relevant columns.
+    df (pd.DataFrame): The DataFrame containing the relevant columns, with the trials of 
+                       each volunteer in consecutive rows.
+    group_column (str, optional): Column identifying the volunteer. Default is 'ID_info' 
+                                  (the whole table is one volunteer if it is missing).
     
     Returns:
     pd.DataFrame: The updated DataFrame with 'last_was_error' column modified.
     """
     # Reset index
     df = df.reset_index(drop=True)  # Ensure sequential 0-based index
-    
-    # Initialize 'last_was_error' column with NaN or 0
-    df['last_was_error'] = 0
-    
-    # Iterate through the DataFrame starting from the second row
-    for i in range(1, len(df)):
-        # Check if the previous row has stochastic_chain_info == 1
-        if df.at[i-1, 'stochastic_chain_info'] == 1:
-            # Check if the current row's result is correct or incorrect
-            if df.at[i, 'result'] == 'correct':
-                # Set current row and next two rows to 0 if within bounds
-                df.at[i + 1, 'last_was_error'] = 0
-                if i + 2 < len(df):
-                    df.at[i + 2, 'last_was_error'] = 0
-                if i + 3 < len(df):
-                    df.at[i + 3, 'last_was_error'] = 0
-            elif df.at[i, 'result'] == 'incorrect':
-                # Set current row and next two rows to 1 if within bounds
-                df.at[i + 1, 'last_was_error'] = 1
-                if i + 2 < len(df):
-                    df.at[i + 2, 'last_was_error'] = 1
-                if i + 3 < len(df):
-                    df.at[i + 3, 'last_was_error'] = 1
+    n_rows = len(df)
+    rows = np.arange(n_rows)
+    chain = df['stochastic_chain_info'].to_numpy()
+    result = df['result'].to_numpy()
+
+    # First row of each volunteer
+    new_volunteer = np.ones(n_rows, dtype=bool)
+    if group_column in df.columns:
+        volunteers = df[group_column].to_numpy()
+        new_volunteer[1:] = volunteers[1:] != volunteers[:-1]
+    else:
+        new_volunteer[1:] = False
+    volunteer_start = np.maximum.accumulate(np.where(new_volunteer, rows, 0))
+
+    # Labelling trials: answered right after a stochastic_chain_info == 1 trial of the same volunteer
+    after_random = np.zeros(n_rows, dtype=bool)
+    after_random[1:] = chain[:-1] == 1
+    labelling = after_random & ~new_volunteer & ((result == 'correct') | (result == 'incorrect'))
+
+    # Most recent labelling trial before each row; it labels the row if at most 3 rows back
+    last_labelling = np.maximum.accumulate(np.where(labelling, rows, -1))
+    previous = np.concatenate(([-1], last_labelling))[:n_rows]
+    labelled = (previous >= rows - 3) & (previous >= volunteer_start)
+    df['last_was_error'] = (labelled & (result[previous] == 'incorrect')).astype(int)
 
     return df
 
 
-def create_context_column(df):
-    # Initialize the context column with NaN and set its dtype to object
-    df['context'] = np.nan  # Initialize with NaN
-    df['context'] = df['context'].astype(object)  # Set dtype to object
-    
-    # Iterate through the DataFrame
-    for i in range(1, len(df)):
-        # Check for block change
-        if df['block_info'].iloc[i] != df['block_info'].iloc[i - 1]:
-            continue  # The first row of a new block remains NaN
-        
-        # Get the value of stochastic_chain_info from the previous rows
-        prev_value = df['stochastic_chain_info'].iloc[i - 1]
-        
-        if prev_value == 0:
-            # If previous value is 0, check further up
-            if i > 1:
-                prev_value = df['stochastic_chain_info'].iloc[i - 2]
-                if prev_value == 0:
-                    df.loc[i, 'context'] = '00'  # Use .loc for assignment
-                elif prev_value == 1:
-                    df.loc[i, 'context'] = '10'  # Use .loc for assignment
-                elif prev_value == 2:
-                    df.loc[i, 'context'] = '20'  # Use .loc for assignment
-        elif prev_value == 1:
-            df.loc[i, 'context'] = '1'      # Use .loc for assignment
-        elif prev_value == 2:
-            df.loc[i, 'context'] = '2'      # Use .loc for assignment
-    
+# Context trees of the goalkeeper game (tree_info -> contexts). Each context is a string of 
+# stochastic_chain_info symbols, oldest first, e.g. '10' means a 1 followed by a 0.
+TREE_CONTEXTS = {
+    13: ['00', '10', '20', '1', '2']
+}
+
+def context_lookup_table(contexts, n_symbols=3):
+    """
+    Build the lookup table from recent history to the longest matching context.
+
+    History is encoded as an integer in base n_symbols with the most recent symbol as the 
+    least significant digit. Row m of the table holds the context of every history code 
+    when only the m most recent symbols are available (-1 if no context of at most m 
+    symbols matches).
+
+    Parameters:
+    contexts (list): Contexts as strings of symbols, oldest first (e.g. TREE_CONTEXTS[13]).
+    n_symbols (int, optional): Size of the alphabet. Default is 3.
+
+    Returns:
+    numpy.ndarray: Context index table shaped (depth + 1, n_symbols ** depth), where depth 
+                   is the length of the longest context.
+    """
+    depth = max(len(context) for context in contexts)
+    codes = np.arange(n_symbols ** depth)
+    table = np.full((depth + 1, len(codes)), -1, dtype=np.int64)
+
+    # Shorter contexts first, so the longest matching suffix wins
+    for index in sorted(range(len(contexts)), key=lambda i: len(contexts[i])):
+        context = contexts[index]
+        context_code = sum(int(symbol) * n_symbols ** lag for lag, symbol in enumerate(reversed(context)))
+        table[len(context):, codes % n_symbols ** len(context) == context_code] = index
+    return table
+
+def _group_starts(df, boundary_columns=('ID_info', 'block_info')):
+    """First row of the run of consecutive rows (between changes of the boundary columns) of every row."""
+    n_rows = len(df)
+    rows = np.arange(n_rows)
+    group_start = np.zeros(n_rows, dtype=np.int64)
+    for column in boundary_columns:
+        if column in df.columns:
+            values = df[column].to_numpy()
+            changed = np.zeros(n_rows, dtype=bool)
+            changed[1:] = values[1:] != values[:-1]
+            group_start = np.maximum(group_start, np.maximum.accumulate(np.where(changed, rows, 0)))
+    return group_start
+
+def _history_codes(df, depth, boundary_columns=('ID_info', 'block_info')):
+    """
+    Base-3 code of the previous stochastic_chain_info symbols of every trial (most recent 
+    symbol least significant) and the number of them available (at most depth). History 
+    stops at a change of the boundary columns and at symbols outside 0-2.
+    """
+    chain = df['stochastic_chain_info'].to_numpy()
+    n_rows = len(chain)
+    rows = np.arange(n_rows)
+
+    # First row of the history of each trial: after the last boundary or invalid symbol
+    history_start = _group_starts(df, boundary_columns)
+    valid = np.isin(chain, [0, 1, 2])
+    last_invalid = np.maximum.accumulate(np.where(valid, -1, rows))
+    history_start = np.maximum(history_start, np.concatenate(([-1], last_invalid))[:n_rows] + 1)
+    available = np.minimum(rows - history_start, depth)
+
+    symbols = np.where(valid, chain, 0).astype(np.int64)
+    code = np.zeros(n_rows, dtype=np.int64)
+    for lag in range(1, depth + 1):
+        code[lag:] += np.where(available[lag:] >= lag, symbols[:-lag], 0) * 3 ** (lag - 1)
+    return code, available
+
+def create_context_column(df, contexts=None, boundary_columns=('ID_info', 'block_info')):
+    """
+    Label every trial with the context (longest matching suffix of the previous 
+    stochastic_chain_info symbols) of a context tree, in one vectorized pass.
+
+    The previous symbols of each trial are encoded as a base-3 code and the context is 
+    read from the table of context_lookup_table. History never reaches back across a 
+    change of the boundary columns (a new block or volunteer) or past a symbol outside 
+    0-2 (e.g. a missing trial), so trials whose available history is too short for any 
+    context stay NaN, such as the first trial of every block.
+
+    Parameters:
+    df (pd.DataFrame): DataFrame with 'stochastic_chain_info' and the boundary columns.
+    contexts (list, optional): Contexts of the tree, oldest symbol first. Default is 
+                               TREE_CONTEXTS[13].
+    boundary_columns (tuple, optional): Columns whose changes start a new history. Missing 
+                                        columns are ignored. Default is ('ID_info', 'block_info').
+
+    Returns:
+    pd.DataFrame: The DataFrame with the 'context' column (strings, NaN without context).
+    """
+    contexts = TREE_CONTEXTS[13] if contexts is None else contexts
+    table = context_lookup_table(contexts)
+    code, available = _history_codes(df, table.shape[0] - 1, boundary_columns)
+
+    labels = np.array(list(contexts) + [np.nan], dtype=object)
+    df['context'] = labels[table[available, code]]
     return df
 
+def _group_codes(df, group_columns):
+    """Group index of each row and the group labels (one group if group_columns is empty)."""
+    if not group_columns:
+        return np.zeros(len(df), dtype=np.int64), pd.Index([0])
+    codes, groups = pd.MultiIndex.from_frame(df[list(group_columns)]).factorize(sort=True)
+    return codes.astype(np.int64), groups.set_names(list(group_columns))
+
+def _symbol_counts(group_codes, n_groups, history, n_histories, symbols, rows):
+    """Counts of each symbol (0-2) after each history, per group, with one bincount."""
+    rows = rows & np.isin(symbols, [0, 1, 2])
+    flat = (group_codes[rows] * n_histories + history[rows]) * 3 + symbols[rows].astype(np.int64)
+    return np.bincount(flat, minlength=n_groups * n_histories * 3).reshape(n_groups, n_histories, 3)
+
+def ngram_counts(df, max_order=4, group_columns=('ID_info', 'block_info'), 
+                 boundary_columns=('ID_info', 'block_info')):
+    """
+    Count the chain symbols and responses following every history of the chain.
 
+    The previous max_order chain symbols of each trial are encoded once as a base-3 code 
+    (most recent symbol least significant), so the history of order k is the code modulo 
+    3**k. For every order the counts of all groups come from a single np.bincount.
 
+    Parameters:
+    df (pd.DataFrame): DataFrame with 'stochastic_chain_info' and 'response_info' (alfabet 
+                       numbers 0-2, other values are left out), in trial order.
+    max_order (int, optional): Longest history. Default is 4.
+    group_columns (tuple, optional): Columns defining the groups counted separately. 
+                                     Default is per volunteer and block.
+    boundary_columns (tuple, optional): Columns whose changes start a new history. 
+                                        Default is ('ID_info', 'block_info').
 
+    Returns:
+    dict: 'groups' (labels of the groups) and 'chain' and 'response', lists indexed by 
+          order k of counts shaped (n_groups, 3**k, 3): how often each chain symbol 
+          occurred, and each response was given, after each history of k symbols.
+    """
+    code, available = _history_codes(df, max_order, boundary_columns)
+    group_codes, groups = _group_codes(df, group_columns)
+    chain = df['stochastic_chain_info'].to_numpy()
+    response = df['response_info'].to_numpy()
+
+    counts = {'groups': groups, 'chain': [], 'response': []}
+    for order in range(max_order + 1):
+        history, rows = code % 3 ** order, available >= order
+        counts['chain'].append(_symbol_counts(group_codes, len(groups), history, 3 ** order, chain, rows))
+        counts['response'].append(_symbol_counts(group_codes, len(groups), history, 3 ** order, response, rows))
+    return counts
+
+def conditional_probabilities(counts, pseudocount=0):
+    """
+    Normalize counts to conditional probabilities along the last axis.
 
+    Parameters:
+    counts (np.ndarray): Counts with the symbols along the last axis (e.g. from ngram_counts).
+    pseudocount (float, optional): Added to every count (additive smoothing). Default is 0.
 
+    Returns:
+    np.ndarray: Probabilities, NaN for histories that never occurred (without pseudocount).
+    """
+    counts = counts + pseudocount
+    total = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, counts / total, np.nan)
 
+def context_counts(df, contexts=None, group_columns=('ID_info', 'block_info'), 
+                   boundary_columns=('ID_info', 'block_info')):
+    """
+    Count the chain symbols and responses following every context of a context tree.
 
+    Parameters:
+    df (pd.DataFrame): See ngram_counts.
+    contexts (list, optional): Contexts of the tree, oldest symbol first. Default is 
+                               TREE_CONTEXTS[13].
+    group_columns, boundary_columns: See ngram_counts.
 
+    Returns:
+    dict: 'groups', 'contexts' and 'chain' and 'response' counts shaped 
+          (n_groups, n_contexts, 3).
+    """
+    contexts = TREE_CONTEXTS[13] if contexts is None else contexts
+    table = context_lookup_table(contexts)
+    code, available = _history_codes(df, table.shape[0] - 1, boundary_columns)
+    context_index = table[available, code]
+    group_codes, groups = _group_codes(df, group_columns)
+
+    rows = context_index >= 0
+    return {
+        'groups': groups,
+        'contexts': list(contexts),
+        'chain': _symbol_counts(group_codes, len(groups), context_index, len(contexts), 
+                                df['stochastic_chain_info'].to_numpy(), rows),
+        'response': _symbol_counts(group_codes, len(groups), context_index, len(contexts), 
+                                   df['response_info'].to_numpy(), rows)
+    }
+
+def estimate_context_tree(df, contexts=None, true_probabilities=None, group_columns=('ID_info', 'block_info'), 
+                          boundary_columns=('ID_info', 'block_info'), pseudocount=0.5):
+    """
+    Estimate the response probabilities of every group in every context and their 
+    divergence from the true tree.
+
+    The divergence is the Kullback-Leibler divergence (in nats) of the response 
+    probabilities (smoothed with pseudocount) from the tree's transition probabilities. 
+    Without true_probabilities, the transition probabilities of the tree are estimated 
+    from the chain of all groups pooled.
+
+    Parameters:
+    df (pd.DataFrame): See ngram_counts.
+    contexts (list, optional): Contexts of the tree. Default is TREE_CONTEXTS[13].
+    true_probabilities (array-like, optional): Transition probabilities of each context, 
+                                               shaped (n_contexts, 3).
+    group_columns, boundary_columns: See ngram_counts.
+    pseudocount (float, optional): Additive smoothing of the response counts. Default is 0.5.
+
+    Returns:
+    pd.DataFrame: One row per group and context with the group columns, 'context', 
+                  'n_trials', the chain ('p_chain_<s>') and response ('p_response_<s>') 
+                  probabilities of each symbol s and 'kl_divergence'.
+    """
+    counts = context_counts(df, contexts, group_columns, boundary_columns)
+    if true_probabilities is None:
+        true_probabilities = conditional_probabilities(counts['chain'].sum(axis=0))
+    true_probabilities = np.asarray(true_probabilities, dtype=float)
+
+    n_trials = counts['response'].sum(axis=-1)
+    p_chain = conditional_probabilities(counts['chain'])
+    p_response = np.where(n_trials[..., np.newaxis] > 0, 
+                          conditional_probabilities(counts['response'], pseudocount), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        terms = np.where(true_probabilities > 0, true_probabilities * np.log(true_probabilities / p_response), 0)
+    divergence = terms.sum(axis=-1)
+
+    n_groups, n_contexts = n_trials.shape
+    result = counts['groups'].to_frame(index=False) if group_columns else pd.DataFrame(index=range(1))
+    result = result.loc[result.index.repeat(n_contexts)].reset_index(drop=True)
+    result['context'] = np.tile(counts['contexts'], n_groups)
+    result['n_trials'] = n_trials.ravel()
+    for symbol in range(3):
+        result[f'p_chain_{symbol}'] = p_chain[..., symbol].ravel()
+    for symbol in range(3):
+        result[f'p_response_{symbol}'] = p_response[..., symbol].ravel()
+    result['kl_divergence'] = divergence.ravel()
+    return result
+
+def _rolling_sum_count(values, window_start):
+    """
+    Sum and number of the valid (non-NaN) values from window_start to each row, from 
+    cumulative sums. window_start may hold one row of starts per window size.
+    """
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0], np.cumsum(np.where(valid, values, 0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    window_end = np.arange(1, len(values) + 1)
+    return sums[window_end] - sums[window_start], counts[window_end] - counts[window_start]
+
+def _rolling_median(values, group_start, window, chunk_size=2**16):
+    """
+    Median of the valid values of the last window rows of the same group, for every row.
+
+    The values are laid out with window - 1 NaNs before every group, so the window of each 
+    row is a slice of one strided view. The windows are sorted in chunks of rows (NaN sort 
+    last) and the median read at the middle of the valid values.
+    """
+    n_rows = len(values)
+    new_group = np.ones(n_rows, dtype=bool)
+    new_group[1:] = group_start[1:] != group_start[:-1]
+    position = np.arange(n_rows) + (window - 1) * np.cumsum(new_group)
+    padded = np.full(n_rows + (window - 1) * np.count_nonzero(new_group), np.nan)
+    padded[position] = values
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+
+    medians = np.empty(n_rows)
+    for start in range(0, n_rows, chunk_size):
+        rows = slice(start, start + chunk_size)
+        sorted_windows = np.sort(windows[position[rows] - window + 1], axis=1)
+        n_valid = np.count_nonzero(~np.isnan(sorted_windows), axis=1)[:, np.newaxis]
+        lower = np.take_along_axis(sorted_windows, np.maximum(n_valid - 1, 0) // 2, axis=1)
+        upper = np.take_along_axis(sorted_windows, n_valid // 2, axis=1)
+        medians[rows] = (lower[:, 0] + upper[:, 0]) / 2  # NaN for windows without valid values
+    return medians
+
+def learning_curves(df, windows=(20,), metrics=None, group_columns=('ID_info', 'block_info'), min_periods=1):
+    """
+    Compute trial-by-trial learning curves (rolling and cumulative metrics) of every group 
+    of the pooled trial table in bulk.
+
+    Rolling means come from cumulative sums (one pass for every window size at once), 
+    rolling medians from strided windows. Windows never reach back past the first trial of 
+    the group (a change of the group columns, trials of each group in consecutive rows), 
+    so early trials use the trials available. Missing values (NaN) are ignored.
+
+    Parameters:
+    df (pd.DataFrame): Trial table of one or many volunteers, in trial order.
+    windows (list, optional): Window sizes in trials; 'cumulative' for all the trials of the 
+                              group so far. Default is (20,).
+    metrics (dict, optional): Metric name -> (column, 'mean' or 'median'). The column 
+                              'correct' is response_info == stochastic_chain_info. Default 
+                              is the success rate, the median response time and the mean 
+                              of every 'MEPpp_' column.
+    group_columns (tuple, optional): Columns defining the groups. Default is per volunteer and block.
+    min_periods (int, optional): Fewest valid values for a value (NaN otherwise). Default is 1.
+
+    Returns:
+    pd.DataFrame: Long-format table with the group columns, 'play_info' (if present), 
+                  'trial' (position within the group, from 1), 'window', 'metric' and 'value'.
+    """
+    if metrics is None:
+        metrics = {'success_rate': ('correct', 'mean'), 'response_time': ('response_time_info', 'median')}
+        metrics.update({column: (column, 'mean') for column in df.columns if column.startswith('MEPpp_')})
+
+    group_start = _group_starts(df, group_columns)
+    rows = np.arange(len(df))
+    group_size = np.bincount(group_start, minlength=len(df))
+    window_sizes = [group_size.max(initial=1) if window == 'cumulative' else window for window in windows]
+    window_start = np.maximum(group_start, rows - np.asarray(window_sizes)[:, np.newaxis] + 1)
+
+    base_columns = [column for column in list(group_columns) + ['play_info'] if column in df.columns]
+    base = df[base_columns].reset_index(drop=True)
+    base['trial'] = rows - group_start + 1
+
+    curves = []
+    for name, (column, statistic) in metrics.items():
+        if column == 'correct':
+            values = _is_correct(df).astype(float)
+        else:
+            values = df[column].to_numpy(dtype=float)
+        sums, counts = _rolling_sum_count(values, window_start)
+        for index, window in enumerate(windows):
+            if statistic == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    value = sums[index] / counts[index]
+            else:
+                value = _rolling_median(values, group_start, window_sizes[index])
+            curves.append(base.assign(window=window, metric=name, 
+                                      value=np.where(counts[index] >= min_periods, value, np.nan)))
+    return pd.concat(curves, ignore_index=True)
@@ -0,0 +1,141 @@
+"""
+=================================================
+Cache Functions
+
+Content-addressed on-disk cache for preprocessed signals:
+    Functions that key a recording and its preprocessing parameters.
+    Functions that store and reload filtered signals with their annotations.
+    Functions that keep the cache within a size budget (least recently used first).
+=================================================
+"""
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import mne
+import numpy as np
+
+DEFAULT_CACHE_SIZE = 20 * 1024**3  # bytes
+
+def signal_cache_key(fname, params):
+    """
+    Computes the cache key of a BrainVision recording and its preprocessing parameters.
+
+    The key hashes the contents of the '.vhdr' and '.vmrk' files, the size and modification
+    time of the '.eeg' file (hashing the full payload would cost as much as reading it)
+    and the preprocessing parameters, so any change to one of them gives a new key. Signals 
+    preprocessed with different filter chains or resampling methods are therefore stored 
+    apart; they are not numerically interchangeable (see signal_processing.preprocess_raw).
+
+    Parameters:
+    fname (str or pathlib.Path): Path to the '.vhdr' file.
+    params (dict): Preprocessing parameters, e.g. resampling frequency and filter cutoffs.
+
+    Returns:
+    str: Hexadecimal cache key.
+    """
+    fname = pathlib.Path(fname)
+    digest = hashlib.blake2b(digest_size=16)
+    for suffix in ['.vhdr', '.vmrk']:
+        digest.update(fname.with_suffix(suffix).read_bytes())
+    eeg_stat = fname.with_suffix('.eeg').stat()
+    digest.update(f'{eeg_stat.st_size}:{eeg_stat.st_mtime_ns}'.encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def save_filtered_raw(raw, cache_dir, key, max_bytes=DEFAULT_CACHE_SIZE):
+    """
+    Stores a preprocessed Raw object in the cache and evicts old entries if needed.
+
+    Each entry is a folder holding the signal as 'data.npy', the annotations as
+    'annotations.npz' and the measurement info as 'info.fif'. The entry is written to a
+    temporary folder first, so an interrupted run never leaves a partial entry behind.
+
+    Parameters:
+    raw (mne.io.Raw): Preprocessed (preloaded) Raw object.
+    cache_dir (str or pathlib.Path): Cache folder, created if it does not exist.
+    key (str): Cache key as returned by signal_cache_key.
+    max_bytes (int, optional): Size budget of the whole cache. Default is 20 GiB.
+
+    Returns:
+    pathlib.Path: Folder of the stored entry.
+    """
+    cache_dir = pathlib.Path(cache_dir)
+    entry_dir = cache_dir / key
+    tmp_dir = cache_dir / f'{key}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    np.save(tmp_dir / 'data.npy', raw.get_data())
+    np.savez(tmp_dir / 'annotations.npz',
+             onset=raw.annotations.onset,
+             duration=raw.annotations.duration,
+             description=np.array([str(desc) for desc in raw.annotations.description]))
+    mne.io.write_info(tmp_dir / 'info.fif', raw.info)
+
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    tmp_dir.rename(entry_dir)
+    evict_lru_entries(cache_dir, max_bytes, keep=key)
+    return entry_dir
+
+def load_filtered_raw(cache_dir, key):
+    """
+    Reloads a preprocessed Raw object from the cache.
+
+    The signal is memory-mapped copy-on-write, so only the samples that are actually used
+    are read from disk and the cached file is never modified. Loading an entry marks it as
+    recently used.
+
+    Parameters:
+    cache_dir (str or pathlib.Path): Cache folder.
+    key (str): Cache key as returned by signal_cache_key.
+
+    Returns:
+    mne.io.RawArray or None: The cached Raw object with its annotations, or None if the
+                             key is not in the cache.
+    """
+    entry_dir = pathlib.Path(cache_dir) / key
+    if not entry_dir.is_dir():
+        return None
+
+    data = np.load(entry_dir / 'data.npy', mmap_mode='c')
+    info = mne.io.read_info(entry_dir / 'info.fif')
+    with np.load(entry_dir / 'annotations.npz') as annot:
+        annotations = mne.Annotations(onset=annot['onset'], duration=annot['duration'],
+                                      description=annot['description'], orig_time=info['meas_date'])
+
+    raw = mne.io.RawArray(data, info)
+    raw.set_annotations(annotations)
+    os.utime(entry_dir)  # mark as recently used
+    return raw
+
+def evict_lru_entries(cache_dir, max_bytes, keep=None):
+    """
+    Deletes the least recently used cache entries until the cache fits in max_bytes.
+
+    Parameters:
+    cache_dir (str or pathlib.Path): Cache folder.
+    max_bytes (int): Size budget of the whole cache.
+    keep (str, optional): Key of an entry that must never be evicted (e.g. the one just stored).
+
+    Returns:
+    list: Keys of the evicted entries.
+    """
+    entries = []
+    for entry_dir in pathlib.Path(cache_dir).iterdir():
+        if entry_dir.is_dir() and not entry_dir.name.endswith('.tmp'):
+            size = sum(f.stat().st_size for f in entry_dir.iterdir())
+            entries.append((entry_dir.stat().st_mtime, size, entry_dir))
+
+    total_size = sum(size for _, size, _ in entries)
+    evicted = []
+    for _, size, entry_dir in sorted(entries, key=lambda entry: entry[0]):
+        if total_size <= max_bytes:
+            break
+        if entry_dir.name == keep:
+            continue
+        shutil.rmtree(entry_dir)
+        total_size -= size
+        evicted.append(entry_dir.name)
+    return evicted
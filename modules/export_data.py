@@ -21,6 +21,32 @@ def create_df_from_dict(variables_dict):
     return pd.DataFrame({key: (value if isinstance(value, (list, pd.Series, np.ndarray)) else [value])
                          for key, value in variables_dict.items()})
 
+def nullable_integer_column(values):
+    """
+    Creates an integer export column whose missing (NaN) entries are written blank.
+
+    Parameters:
+    - values: 1D array of whole numbers, with NaN for missing entries.
+
+    Returns:
+    - pandas Series of the nullable Int64 type (left alone by utils.fill_missing_with_symbolic_value).
+    """
+    return pd.Series(values, dtype='Int64')
+
+def channel_columns(name_format, values, muscles):
+    """
+    Creates one export column per muscle from a per-channel matrix.
+
+    Parameters:
+    - name_format: Column name with a '{}' placeholder for the muscle name, e.g. 'MEPpp_{}_µV'.
+    - values: Array shaped (n_rows, n_channels), with columns in the order of muscles.
+    - muscles: List of muscle names (the keys of the channel map).
+
+    Returns:
+    - Dictionary with one column name and 1D array per muscle.
+    """
+    return {name_format.format(muscle): values[:, i] for i, muscle in enumerate(muscles)}
+
 # def create_df_GKlab(df_summary):
 #     df_GKlab = pd.DataFrame({
 #     'group_info': np.full(len(trial_numbers), 1),
@@ -47,3 +73,28 @@ def export_to_GKlab_csv(data, filename):
     df_GKlab = pd.DataFrame(data)
     df_GKlab.to_csv(filename, index=False)
 
+
+def sensitivity_to_df(sensitivity, muscles):
+    """
+    Creates a tidy DataFrame from the result of signal_processing.rms_threshold_sensitivity.
+
+    Parameters:
+    - sensitivity: Dictionary returned by rms_threshold_sensitivity.
+    - muscles: List of muscle names (the keys of the channel map).
+
+    Returns:
+    - DataFrame with one row per threshold, block and muscle.
+    """
+    n_thresholds, n_blocks, n_muscles = sensitivity['excluded'].shape
+    index = np.indices((n_thresholds, n_blocks, n_muscles)).reshape(3, -1)
+    df = pd.DataFrame({
+        'rms_thresh': sensitivity['thresholds'][index[0]],
+        'block_info': sensitivity['blocks'][index[1]],
+        'muscle': np.asarray(muscles)[index[2]],
+        'n_excluded': sensitivity['excluded'].ravel(),
+        'n_kept': sensitivity['kept'].ravel(),
+        'relMean_mean': sensitivity['relMean'].ravel()
+    })
+    if 'relRest' in sensitivity:
+        df['relRest_mean'] = sensitivity['relRest'].ravel()
+    return df
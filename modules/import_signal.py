@@ -4,8 +4,26 @@ Importing data
 =================================================
 """
 import mne
+import numpy as np
 import pathlib
 import pandas as pd
+import re
+
+# BrainVision binary formats and the numpy dtypes they are stored with
+BINARY_FORMATS = {
+    'INT_16': '<i2',
+    'INT_32': '<i4',
+    'IEEE_FLOAT_32': '<f4'
+}
+
+# Scale from BrainVision channel units to volts
+UNIT_SCALES = {
+    'V': 1.0,
+    'mV': 1e-3,
+    'µV': 1e-6,
+    'uV': 1e-6,
+    'nV': 1e-9
+}
 
 def find_vhdr_file(folder_name):
     """
@@ -30,6 +48,160 @@ def import_brainvision_data(fname):
     """Imports EEG/EMG data from a BrainVision file."""
     return mne.io.read_raw_brainvision(fname, preload=True)
 
+def _read_text(fname):
+    """Reads a BrainVision text file, falling back to Latin-1 for old recordings."""
+    raw_bytes = pathlib.Path(fname).read_bytes()
+    try:
+        return raw_bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw_bytes.decode('latin-1')
+
+def _read_section(text, section):
+    """Returns the 'key=value' lines of an INI-like section as a dictionary."""
+    match = re.search(r'^\[' + re.escape(section) + r'\]\s*$', text, re.MULTILINE | re.IGNORECASE)
+    if match is None:
+        return {}
+    entries = {}
+    for line in text[match.end():].splitlines():
+        line = line.strip()
+        if line.startswith('['):
+            break
+        if not line or line.startswith(';') or '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        entries[key.strip()] = value.strip()
+    return entries
+
+def read_brainvision_header(fname):
+    """
+    Reads the recording layout from a BrainVision '.vhdr' header file.
+
+    Parameters:
+    fname (str or pathlib.Path): Path to the '.vhdr' file.
+
+    Returns:
+    dict: Header information with the keys 'data_file' and 'marker_file' (pathlib.Path), 
+          'sfreq' (float), 'ch_names' (list), 'scales' (ndarray, volts per stored unit), 
+          'dtype' (str) and 'orientation' ('MULTIPLEXED' or 'VECTORIZED').
+    """
+    fname = pathlib.Path(fname)
+    text = _read_text(fname)
+    common = _read_section(text, 'Common Infos')
+    binary = _read_section(text, 'Binary Infos')
+    channels = _read_section(text, 'Channel Infos')
+
+    n_channels = int(common['NumberOfChannels'])
+    ch_names, scales = [], []
+    for ch in range(1, n_channels + 1):
+        fields = channels.get(f'Ch{ch}', '').split(',')
+        ch_names.append(fields[0] if fields[0] else f'Ch{ch}')
+        resolution = float(fields[2]) if len(fields) > 2 and fields[2] else 1.0
+        unit = fields[3] if len(fields) > 3 and fields[3] else 'µV'
+        scales.append(resolution * UNIT_SCALES.get(unit, 1e-6))
+
+    return {
+        'data_file': fname.parent / common['DataFile'],
+        'marker_file': fname.parent / common['MarkerFile'],
+        'sfreq': 1e6 / float(common['SamplingInterval']),
+        'ch_names': ch_names,
+        'scales': np.array(scales),
+        'dtype': BINARY_FORMATS[binary.get('BinaryFormat', 'INT_16')],
+        'orientation': common.get('DataOrientation', 'MULTIPLEXED').upper()
+    }
+
+def read_brainvision_markers(fname):
+    """
+    Reads the marker table of a BrainVision recording without touching the signal.
+
+    Markers are returned as MNE names them ('Type/Description'), sorted by their 0-based 
+    sample positions at the native sampling frequency. The leading 'New Segment' marker, which 
+    only holds the recording date, is skipped.
+
+    Parameters:
+    fname (str or pathlib.Path): Path to the '.vhdr' file.
+
+    Returns:
+    tuple: A tuple containing:
+        - samples (ndarray): Marker sample positions (int64).
+        - descriptions (ndarray): Marker names such as 'Display/D  4'.
+    """
+    header = read_brainvision_header(fname)
+    markers = _read_section(_read_text(header['marker_file']), 'Marker Infos')
+
+    samples, descriptions = [], []
+    for key, value in markers.items():
+        if not key.startswith('Mk'):
+            continue
+        fields = value.split(',')
+        marker_type = fields[0].replace(r'\1', ',')
+        marker_desc = fields[1].replace(r'\1', ',')
+        samples.append(int(fields[2]) - 1)  # BrainVision positions are 1-based
+        descriptions.append(f'{marker_type}/{marker_desc}')
+
+    if descriptions and descriptions[0].startswith('New Segment/'):
+        samples, descriptions = samples[1:], descriptions[1:]
+
+    # Keep the onset order MNE gives to annotations
+    samples = np.array(samples, dtype=np.int64)
+    order = np.argsort(samples, kind='stable')
+    return samples[order], np.array(descriptions, dtype=str)[order]
+
+def import_brainvision_events(fname, sfreq=None):
+    """
+    Builds the events array of a BrainVision recording from its '.vmrk' file only.
+
+    The result matches mne.events_from_annotations on the loaded (and possibly resampled) 
+    recording: marker names are numbered 1, 2, ... in sorted order and sample positions 
+    are rounded to the requested sampling frequency. The '.eeg' payload is never read, 
+    so behavioural outputs can be computed without loading the signal.
+
+    Parameters:
+    fname (str or pathlib.Path): Path to the '.vhdr' file.
+    sfreq (float, optional): Sampling frequency of the returned sample positions. 
+                             Defaults to the native sampling frequency of the recording.
+
+    Returns:
+    tuple: A tuple containing:
+        - events (ndarray): Array of shape (n_events, 3) with sample, 0 and event code.
+        - event_dict (dict): Mapping from marker name to event code.
+    """
+    samples, descriptions = read_brainvision_markers(fname)
+    native_sfreq = read_brainvision_header(fname)['sfreq']
+    if sfreq is not None and sfreq != native_sfreq:
+        samples = np.round(samples / native_sfreq * sfreq).astype(np.int64)
+
+    names, codes = np.unique(descriptions, return_inverse=True)
+    event_dict = {str(name): code for code, name in enumerate(names, start=1)}
+
+    events = np.column_stack((samples, np.zeros_like(samples), codes + 1)).astype(int)
+    return events, event_dict
+
+def memmap_brainvision_data(fname):
+    """
+    Memory-maps the binary signal of a BrainVision recording.
+
+    Nothing is read from disk until the returned array is indexed, so slicing a few 
+    windows only pages in those samples. This is the windowed reader of the event_local 
+    mode: signal_processing.filter_event_segments gathers its padded event segments 
+    from the returned array.
+
+    Parameters:
+    fname (str or pathlib.Path): Path to the '.vhdr' file.
+
+    Returns:
+    tuple: A tuple containing:
+        - data (numpy.memmap): Stored samples shaped (n_times, n_channels), in file units.
+        - header (dict): Header information as returned by read_brainvision_header.
+    """
+    header = read_brainvision_header(fname)
+    data = np.memmap(header['data_file'], dtype=header['dtype'], mode='r')
+    n_channels = len(header['ch_names'])
+    if header['orientation'] == 'VECTORIZED':
+        data = data.reshape(n_channels, -1).T
+    else:
+        data = data.reshape(-1, n_channels)
+    return data, header
+
 def import_csv_data(file_path, file_name):
     """
     Import a CSV file from a specified path.    
@@ -9,6 +9,7 @@ import mne
 from scipy.stats import linregress
 import seaborn as sns
 import pandas as pd
+from modules import analysis
 
 def plot_psd(data, fmax=600):
     """Plot Power Spectral Density (PSD) of the data."""
@@ -60,73 +61,58 @@ def plot_spectrum_amplitude(signal, start_time=0.0, stop_time=None, channel_inde
     plt.grid(True)
     plt.show()
 
-def plot_emg_data(x, data_filtered, win_1, win_2, ax1, ax2):
-    """Plot EMG data on two axes."""
-    ax1.plot(x * 1000, win_1 * 1e6, color="gray", alpha=0.08)
-    ax2.plot(x * 1000, win_2 * 1e6, color="gray", alpha=0.08)
+def plot_emg_data(x, windows, axes):
+    """Plot EMG data with one axis per channel. windows is shaped (n_channels, n_samples) or (n_events, n_channels, n_samples)."""
+    windows = np.asarray(windows).reshape(-1, len(axes), len(x))
+    for i, ax in enumerate(axes):
+        ax.plot(x * 1000, windows[:, i].T * 1e6, color="gray", alpha=0.08)
 
-def configure_plot(data_filtered, ax1, ax2):
+def configure_plot(ch_names, axes):
     """Configure plot labels, titles, and axes."""
-    ax1.axvline(x=0, color='k', linestyle='--')
-    ax2.axvline(x=0, color='k', linestyle='--')
-    ax1.set_title(f"EMG {data_filtered.ch_names[0]}")
-    ax2.set_title(f"EMG {data_filtered.ch_names[1]}")
-    ax1.set_xlabel('Time [ms]')
-    ax1.set_ylabel('Voltage [uV]')
-    ax2.set_xlabel('Time [ms]')
-    ax2.set_ylabel('Voltage [uV]')
+    for ax, ch_name in zip(axes, ch_names):
+        ax.axvline(x=0, color='k', linestyle='--')
+        ax.set_title(f"EMG {ch_name}")
+        ax.set_xlabel('Time [ms]')
+        ax.set_ylabel('Voltage [uV]')
     plt.show()
 
-def create_figure(window_title):
-    """Create a figure with two subplots."""
-    f, (ax1, ax2) = plt.subplots(1, 2)
+def create_figure(window_title, n_axes=2):
+    """Create a figure with one subplot per channel (two by default)."""
+    f, axes = plt.subplots(1, n_axes, squeeze=False)
     f.canvas.manager.set_window_title(window_title)
-    return f, ax1, ax2
+    return f, *axes[0]
 
 
-def plot_rms_amplitudes(rms_time_points, rms_1, rms_2, rms_threshold_ch1, rms_threshold_ch2, data_filtered):
-    f, (ax1, ax2) = plt.subplots(1, 2)
+def plot_rms_amplitudes(rms_time_points, rms, rms_thresholds, ch_names):
+    """Plot RMS amplitudes over time, one subplot per channel. rms is shaped (n_events, n_channels)."""
+    f, axes = plt.subplots(1, len(ch_names), squeeze=False)
     f.canvas.manager.set_window_title("Figure 7")
 
-    excluded_rms_1 = np.where((rms_1 > rms_threshold_ch1), rms_1 * 1e6, np.nan)
-    ax1.plot(rms_time_points, rms_1 * 1e6, marker='o', linestyle='None', label='Included RMS')
-    ax1.plot(rms_time_points, excluded_rms_1, 'ro', label='Excluded RMS', alpha=0.5)
-
-    excluded_rms_2 = np.where((rms_2 > rms_threshold_ch2), rms_2 * 1e6, np.nan)
-    ax2.plot(rms_time_points, rms_2 * 1e6, marker='o', linestyle='None', label='Included RMS')
-    ax2.plot(rms_time_points, excluded_rms_2, 'ro', label='Excluded RMS', alpha=0.5)
-
-    ax1.set_title(f"RMS Amplitude {data_filtered.ch_names[0]}")
-    ax2.set_title(f"RMS Amplitude {data_filtered.ch_names[1]}")
-    ax1.set_xlabel('Time [s]')
-    ax1.set_ylabel('RMS Amplitude')
-    ax2.set_xlabel('Time [s]')
-    ax2.set_ylabel('RMS Amplitude')
-    ax1.legend()
-    ax2.legend()
+    excluded_rms = np.where((rms > rms_thresholds), rms * 1e6, np.nan)
+    for i, ax in enumerate(axes[0]):
+        ax.plot(rms_time_points, rms[:, i] * 1e6, marker='o', linestyle='None', label='Included RMS')
+        ax.plot(rms_time_points, excluded_rms[:, i], 'ro', label='Excluded RMS', alpha=0.5)
+
+        ax.set_title(f"RMS Amplitude {ch_names[i]}")
+        ax.set_xlabel('Time [s]')
+        ax.set_ylabel('RMS Amplitude')
+        ax.legend()
     plt.show()
 
-def plot_mep_amplitudes(rms_time_points, p2p_1, p2p_2, rms_1, rms_2, rms_threshold_ch1, rms_threshold_ch2, data_filtered):
-    f, (ax1, ax2) = plt.subplots(1, 2)
+def plot_mep_amplitudes(rms_time_points, p2p, rms, rms_thresholds, ch_names):
+    """Plot MEP amplitudes over time, one subplot per channel. p2p and rms are shaped (n_events, n_channels)."""
+    f, axes = plt.subplots(1, len(ch_names), squeeze=False)
     f.canvas.manager.set_window_title("Figure 8")
 
-    excluded_mep_1 = np.where((rms_1 > rms_threshold_ch1), p2p_1 * 1e6, np.nan)
-    ax1.plot(rms_time_points, p2p_1 * 1e6, marker='o', linestyle='None', label='Included MEP')
-    ax1.plot(rms_time_points, excluded_mep_1, 'ro', label='Excluded MEP', alpha=0.5)
-
-    excluded_mep_2 = np.where((rms_2 > rms_threshold_ch2), p2p_2 * 1e6, np.nan)
-    ax2.plot(rms_time_points, p2p_2 * 1e6, marker='o', linestyle='None', label='Included MEP')
-    ax2.plot(rms_time_points, excluded_mep_2, 'ro', label='Excluded MEP', alpha=0.5)
-
-    ax1.set_title(f"MEP Amplitude {data_filtered.ch_names[0]}")
-    ax1.set_xlabel('Time [s]')
-    ax1.set_ylabel('Voltage [µV]')
-    ax1.legend()
+    excluded_mep = np.where((rms > rms_thresholds), p2p * 1e6, np.nan)
+    for i, ax in enumerate(axes[0]):
+        ax.plot(rms_time_points, p2p[:, i] * 1e6, marker='o', linestyle='None', label='Included MEP')
+        ax.plot(rms_time_points, excluded_mep[:, i], 'ro', label='Excluded MEP', alpha=0.5)
 
-    ax2.set_title(f"MEP Amplitude {data_filtered.ch_names[1]}")
-    ax2.set_xlabel('Time [s]')
-    ax2.set_ylabel('Voltage [µV]')
-    ax2.legend()
+        ax.set_title(f"MEP Amplitude {ch_names[i]}")
+        ax.set_xlabel('Time [s]')
+        ax.set_ylabel('Voltage [µV]')
+        ax.legend()
 
     plt.show()
 
@@ -250,35 +236,18 @@ def plot_success_rate_comparison_group(list1, list2, labels):
     plt.tight_layout()
     plt.show()   
     
-def plot_success_rates_by_blocks_group(df):
+def plot_success_rates_by_blocks_group(df, cube=None):
     """
     Create boxplots showing success rates for each block, with data grouped by volunteers (ID_info).
 
     Parameters:
     df (pd.DataFrame): A DataFrame containing 'ID_info', 'block_info', 'response_info', and 'stochastic_chain_info'.
+    cube (pd.DataFrame, optional): Success-rate cube of df (analysis.build_success_rate_cube), built if not given.
     """
-    # Calculate success rates by ID and block
-    results = {}
-
-    # Group by 'ID_info'
-    for id_value, group in df.groupby('ID_info'):
-        # For each ID, calculate success rates for each block
-        success_rates = group.groupby('block_info').apply(
-            lambda block: (block['response_info'] == block['stochastic_chain_info']).mean()
-        ).to_dict()
-        
-        # Store the results in the dictionary
-        results[id_value] = success_rates
-
-    # Prepare data for plotting
-    plot_data = []
-    
-    for id_value, blocks in results.items():
-        for block, rate in blocks.items():
-            plot_data.append({'ID_info': id_value, 'block_info': block, 'success_rate': rate})
-
-    # Create a DataFrame from the prepared data
-    plot_df = pd.DataFrame(plot_data)
+    # Success rates by ID and block, read from the success-rate cube
+    if cube is None:
+        cube = analysis.build_success_rate_cube(df, by=('ID_info', 'block_info'))
+    plot_df = analysis.rollup_success_rates(cube, ['ID_info', 'block_info'])
 
     # Define colors for volunteers (dots)
     unique_volunteer_colors = sns.color_palette("husl", len(plot_df['ID_info'].unique()))
@@ -812,3 +781,25 @@ def boxplot_dataframe_twocategories(df, xdata: str, ydata: str, huedata: str, xl
 
 
 
+
+def plot_learning_curves(curves, metric, group_column='block_info', ylabel=None):
+    """
+    Plot learning curves (mean across volunteers with 95% CI), one subplot per group and 
+    one line per window size.
+
+    Parameters:
+    curves (pd.DataFrame): Long-format table returned by analysis.learning_curves.
+    metric (str): Metric to plot (a value of the 'metric' column), e.g. 'success_rate'.
+    group_column (str, optional): Column with one subplot per value. Default is 'block_info'.
+    ylabel (str, optional): Label of the y axis. Defaults to the metric name.
+    """
+    data = curves[curves['metric'] == metric].astype({'window': str})
+    grid = sns.relplot(data=data, x='trial', y='value', hue='window', col=group_column, kind='line',
+                       col_wrap=min(4, data[group_column].nunique()), height=3, aspect=1.2, errorbar=('ci', 95))
+
+    # Set labels and remove right and top spines
+    grid.set_axis_labels('Trial', ylabel if ylabel is not None else metric)
+    grid.despine()
+
+    # Show the plot
+    plt.show()
@@ -8,24 +8,53 @@ Functions that directly manipulate or analyze the signal based on markers:
     Functions that plot or visualize the signal with respect to the markers
 ============================================
 """
+import itertools
+import json
 import mne
 import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from scipy import signal
 
-def downsample_data(raw, new_sfreq=3000):
-    """Downsamples raw data to a new sample frequency."""
-    raw.resample(new_sfreq)
-    return raw
+def downsample_data(raw, new_sfreq=3000, method='fft', chunk_size=2**20):
+    """
+    Downsamples raw data to a new sample frequency.
+
+    Parameters:
+    raw (mne.io.Raw): Preloaded Raw object.
+    new_sfreq (float, optional): New sampling frequency. Default is 3000 Hz.
+    method (str, optional): 'fft' resamples the whole recording in place with raw.resample 
+                            (one FFT per channel over the full session). 'polyphase' 
+                            resamples by a rational up/down factor (e.g. 3/5 for 5 kHz to 
+                            3 kHz) in chunks of chunk_size samples with 
+                            resample_poly_chunked, and returns a new Raw object with the 
+                            annotations of raw. Default is 'fft'.
+    chunk_size (int, optional): Samples per chunk for method='polyphase'. Default is 2**20.
+
+    Returns:
+    mne.io.Raw: The resampled Raw object.
+    """
+    if method == 'fft':
+        raw.resample(new_sfreq)
+        return raw
+    if method != 'polyphase':
+        raise ValueError(f"Unknown resampling method '{method}' (use 'fft' or 'polyphase').")
+    data = resample_poly_chunked(raw._data, raw.info['sfreq'], new_sfreq, chunk_size=chunk_size)
+    return _raw_with_annotations(raw, data, new_sfreq)
 
 def notch_filter_data(raw, freqs=60):
-    """Applies a notch filter to the raw data."""
-    return raw.copy().notch_filter(freqs=freqs)
+    """Applies a notch filter to the raw data (MNE's default FIR notch, taps taken from the filter registry)."""
+    taps = get_notch_design(raw.info['sfreq'], freqs)['fir']
+    return raw.copy().apply_function(fir_filter_zero_phase, picks='data', taps=taps)
 
 def apply_bandpass_filter(raw, l_freq=20, h_freq=500):
-    """Apply Butterworth bandpass filter from l_freq to h_freq."""
+    """Apply Butterworth bandpass filter from l_freq to h_freq (design taken from the filter registry)."""
+    iir_params = get_filter_design(raw.info['sfreq'], l_freq, h_freq, order=2, ftype='butter')
     data_filtered = mne.filter.filter_data(raw.get_data(), 
                                            sfreq=raw.info['sfreq'], 
                                            l_freq=l_freq, h_freq=h_freq, 
-                                           method='iir', iir_params=dict(order=2, ftype='butter'))
+                                           method='iir', iir_params=dict(iir_params), verbose=False)
     return data_filtered
 
 def create_filtered_raw_object(data_filtered, raw_info):
@@ -33,6 +62,561 @@ def create_filtered_raw_object(data_filtered, raw_info):
     raw_filtered = mne.io.RawArray(data_filtered, raw_info)
     return raw_filtered
 
+# Filter-design registry: filter_design_key or notch_design_key -> {'sos' or 'fir': ..., 'padlen': ...}
+_filter_designs = {}
+
+def filter_design_key(sfreq, l_freq=20, h_freq=500, order=2, ftype='butter'):
+    """Return the registry key (a tuple of plain numbers and strings) of a bandpass design."""
+    return (float(sfreq), float(l_freq), float(h_freq), int(order), str(ftype))
+
+def get_filter_design(sfreq, l_freq=20, h_freq=500, order=2, ftype='butter'):
+    """
+    Return the SOS coefficients and padding of a bandpass filter, designing it only on first use.
+
+    Designs are kept in a registry keyed by filter_design_key, so every volunteer recorded 
+    at the same sampling frequency reuses the same coefficients. The design is the 
+    bandpass of apply_bandpass_filter as MNE designs it (padlen from its ringing estimate), 
+    and the returned dict can be passed to MNE as iir_params.
+
+    Parameters:
+    sfreq (float): Sampling frequency of the signal to be filtered.
+    l_freq (float, optional): Bandpass low cutoff in Hz. Default is 20 Hz.
+    h_freq (float, optional): Bandpass high cutoff in Hz. Default is 500 Hz.
+    order (int, optional): Bandpass order. Default is 2.
+    ftype (str, optional): Bandpass filter type. Default is 'butter'.
+
+    Returns:
+    dict: 'sos' (array of shape (n_sections, 6), shared: do not modify) and 'padlen' (int).
+    """
+    key = filter_design_key(sfreq, l_freq, h_freq, order, ftype)
+    if key not in _filter_designs:
+        iir_params = mne.filter.create_filter(
+            None, sfreq, l_freq, h_freq, method='iir', 
+            iir_params=dict(order=order, ftype=ftype, output='sos'), verbose=False)
+        _filter_designs[key] = {'sos': iir_params['sos'], 'padlen': int(iir_params['padlen'])}
+    return _filter_designs[key]
+
+def notch_design_key(sfreq, freqs=60, trans_bandwidth=1):
+    """Return the registry key of the FIR notch design of get_notch_design."""
+    return ('notch', float(sfreq), tuple(float(freq) for freq in np.atleast_1d(freqs)), float(trans_bandwidth))
+
+def get_notch_design(sfreq, freqs=60, trans_bandwidth=1):
+    """
+    Return the FIR taps of MNE's default notch filter, designing them only on first use.
+
+    The taps are those raw.notch_filter designs (method='fir', zero phase, Hamming window, 
+    firwin design, notch width freq / 200 and trans_bandwidth Hz of transition), made with 
+    mne.filter.create_filter and kept in the same registry as get_filter_design. Apply 
+    them with fir_filter_zero_phase.
+
+    Parameters:
+    sfreq (float): Sampling frequency of the signal to be filtered.
+    freqs (float or list, optional): Notch frequencies in Hz. Default is 60 Hz.
+    trans_bandwidth (float, optional): Transition bandwidth in Hz. Default is 1 Hz.
+
+    Returns:
+    dict: 'fir' (odd-length taps, shared: do not modify) and 'padlen' (int, the half length 
+          of the filter, i.e. the samples of context each output sample depends on).
+    """
+    key = notch_design_key(sfreq, freqs, trans_bandwidth)
+    if key not in _filter_designs:
+        freqs = np.atleast_1d(freqs).astype(float)
+        half_band = freqs / 400.0 + trans_bandwidth / 2.0
+        taps = mne.filter.create_filter(
+            None, sfreq, list(freqs + half_band), list(freqs - half_band), 
+            l_trans_bandwidth=trans_bandwidth / 2.0, h_trans_bandwidth=trans_bandwidth / 2.0, 
+            method='fir', phase='zero', fir_window='hamming', fir_design='firwin', verbose=False)
+        _filter_designs[key] = {'fir': taps, 'padlen': len(taps) // 2}
+    return _filter_designs[key]
+
+def fir_filter_zero_phase(x, taps):
+    """
+    Zero-phase FIR filtering along the last axis, as MNE applies its FIR filters.
+
+    The signal is extended at both ends by len(taps) - 1 samples of odd reflection (MNE's 
+    'reflect_limited' padding), convolved with the linear-phase taps by overlap-add and 
+    shifted back by half the filter length.
+
+    Parameters:
+    x (numpy.ndarray): Signal with time along the last axis.
+    taps (numpy.ndarray): Odd-length linear-phase FIR taps (e.g. from get_notch_design).
+
+    Returns:
+    numpy.ndarray: The filtered signal, shaped like x.
+    """
+    n_edge = max(min(len(taps), x.shape[-1]) - 1, 0)
+    padding = [(0, 0)] * (x.ndim - 1) + [(n_edge, n_edge)]
+    extended = np.pad(x, padding, mode='reflect', reflect_type='odd')
+    filtered = signal.oaconvolve(extended, taps.reshape((1,) * (x.ndim - 1) + (-1,)), mode='same', axes=-1)
+    return filtered[..., n_edge:n_edge + x.shape[-1]].astype(x.dtype, copy=False)
+
+def save_filter_designs(fname):
+    """
+    Save all filter designs of the registry to a '.npz' file.
+
+    Parameters:
+    fname (str or pathlib.Path): Path of the '.npz' file.
+
+    Returns:
+    int: Number of designs saved.
+    """
+    keys = list(_filter_designs)
+    coefficients = {}
+    for i, key in enumerate(keys):
+        kind = 'fir' if 'fir' in _filter_designs[key] else 'sos'
+        coefficients[f'{kind}_{i}'] = _filter_designs[key][kind]
+    np.savez(fname, keys=json.dumps(keys), padlen=np.array([_filter_designs[key]['padlen'] for key in keys]),
+             **coefficients)
+    return len(keys)
+
+def load_filter_designs(fname):
+    """
+    Load filter designs saved with save_filter_designs into the registry.
+
+    Parameters:
+    fname (str or pathlib.Path): Path of the '.npz' file.
+
+    Returns:
+    int: Number of designs loaded.
+    """
+    with np.load(fname) as saved:
+        keys = json.loads(str(saved['keys']))
+        for i, key in enumerate(keys):
+            key = tuple(tuple(item) if isinstance(item, list) else item for item in key)
+            kind = 'fir' if f'fir_{i}' in saved else 'sos'
+            _filter_designs[key] = {kind: saved[f'{kind}_{i}'], 'padlen': int(saved['padlen'][i])}
+    return len(keys)
+
+def resample_factors(sfreq, new_sfreq):
+    """Return the (up, down) integer factors that resample sfreq to new_sfreq."""
+    ratio = Fraction(new_sfreq).limit_denominator() / Fraction(sfreq).limit_denominator()
+    return ratio.numerator, ratio.denominator
+
+def resample_poly_chunked(data, sfreq, new_sfreq, chunk_size=2**20):
+    """
+    Polyphase resampling of the last axis of data, in chunks of bounded size.
+
+    Gives the same result as scipy.signal.resample_poly over the whole signal (same Kaiser 
+    FIR anti-alias filter), but only one chunk plus the filter overlap is resampled at a 
+    time. Chunks start at multiples of the down factor, so every output sample falls on the 
+    same position of the input as in the whole-signal resampling.
+
+    Parameters:
+    data (numpy.ndarray): Signal with time on the last axis.
+    sfreq (float): Sampling frequency of data.
+    new_sfreq (float): New sampling frequency.
+    chunk_size (int, optional): Input samples per chunk. Default is 2**20.
+
+    Returns:
+    numpy.ndarray: The resampled signal (float64), with ceil(n_times * up / down) samples.
+    """
+    up, down = resample_factors(sfreq, new_sfreq)
+    n_times = data.shape[-1]
+    n_out = -(-n_times * up // down)
+    # Input samples reached by the resample_poly filter (half length 10 * max(up, down) 
+    # at the upsampled rate), rounded up to a multiple of down
+    overlap = -(-(10 * max(up, down) // up + 2) // down) * down
+    step = max(chunk_size // down, 1) * down
+
+    resampled = np.empty(data.shape[:-1] + (n_out,))
+    for start in range(0, n_times, step):
+        stop = min(start + step, n_times)
+        chunk_start = max(start - overlap, 0)
+        chunk = signal.resample_poly(data[..., chunk_start:min(stop + overlap, n_times)], up, down, axis=-1)
+        out_start = start * up // down
+        out_stop = -(-stop * up // down)
+        first = out_start - chunk_start * up // down
+        resampled[..., out_start:out_stop] = chunk[..., first:first + out_stop - out_start]
+    return resampled
+
+def _raw_with_annotations(raw, data, sfreq):
+    """Create a RawArray of data at sfreq with the channels, measurement date and annotations of raw."""
+    info = mne.create_info(raw.ch_names, sfreq, ch_types=raw.get_channel_types())
+    info.set_meas_date(raw.info['meas_date'])
+    raw_new = mne.io.RawArray(data, info)
+    raw_new.set_annotations(raw.annotations)
+    return raw_new
+
+def preprocess_raw(raw, new_sfreq=3000, notch_freqs=60, l_freq=20, h_freq=500, order=2, chunk_size=2**20):
+    """
+    Resample, notch and bandpass filter a Raw object with bounded extra memory.
+
+    Replaces the downsample_data -> notch_filter_data -> apply_bandpass_filter -> 
+    create_filtered_raw_object chain with the same filters, in the same order and at the 
+    same rate: the signal is resampled in chunks (resample_poly_chunked), then each channel 
+    of the resampled buffer is notch filtered with the FIR taps of notch_filter_data and 
+    bandpass filtered with the design of apply_bandpass_filter, both padded at the edges 
+    as MNE pads them. The resampled buffer (new_sfreq / sfreq of the original size) is 
+    filtered in place, so the only other allocations are one channel of temporaries, 
+    instead of a full copy of the recording per step.
+
+    The result equals the MNE chain with resample_method='polyphase' to floating point 
+    precision. It is not interchangeable with the default 'fft' resampling of the MNE 
+    chain: the ideal FFT lowpass spreads a large stimulus artifact as slowly decaying sinc 
+    ringing, while the polyphase filter is short. On noise the two agree to about 0.1%, 
+    but baseline RMS windows reached by artifact ringing differ by a few %, which changes 
+    the RMS-SD exclusions (11 vs 26 of 1205 trials on a synthetic recording with 20 mV 
+    artifacts). Do not compare MEP/RMS values or exclusion thresholds across resampling 
+    methods.
+
+    Parameters:
+    raw (mne.io.Raw): Preloaded Raw object (not modified).
+    new_sfreq (float, optional): Sampling frequency after resampling. Default is 3000 Hz.
+    notch_freqs (float, list or None, optional): Notch frequencies in Hz (None for no notch). 
+                                                Default is 60 Hz.
+    l_freq (float, optional): Bandpass low cutoff in Hz. Default is 20 Hz.
+    h_freq (float, optional): Bandpass high cutoff in Hz. Default is 500 Hz.
+    order (int, optional): Butterworth bandpass order. Default is 2.
+    chunk_size (int, optional): Input samples per resampling chunk. Default is 2**20.
+
+    Returns:
+    mne.io.RawArray: The filtered Raw object at new_sfreq, with the annotations of raw.
+    """
+    data = resample_poly_chunked(raw._data, raw.info['sfreq'], new_sfreq, chunk_size=chunk_size)
+    bandpass = get_filter_design(new_sfreq, l_freq, h_freq, order)
+    padlen = min(bandpass['padlen'], data.shape[-1] - 1)
+
+    for channel in data:
+        if notch_freqs is not None:
+            channel[:] = fir_filter_zero_phase(channel, get_notch_design(new_sfreq, notch_freqs)['fir'])
+        channel[:] = signal.sosfiltfilt(bandpass['sos'], channel, padlen=padlen)
+    return _raw_with_annotations(raw, data, new_sfreq)
+
+def iir_padding_samples(sos, tol=1e-4):
+    """
+    Number of samples it takes the start-up transient of an SOS filter to settle.
+
+    The transient decays as the slowest pole of the filter, so it falls below tol of its 
+    initial size after log(tol) / log(max|pole|) samples. Padding event segments by this 
+    many samples on each side keeps the transient of zero-phase filtering out of the 
+    event windows.
+
+    Parameters:
+    sos (numpy.ndarray): Second-order sections of the filter.
+    tol (float, optional): Fraction of the initial transient considered settled. Default is 1e-4.
+
+    Returns:
+    int: Settling length in samples.
+    """
+    poles = np.concatenate([np.roots(section[3:]) for section in sos])
+    return int(np.ceil(np.log(tol) / np.log(np.max(np.abs(poles)))))
+
+def remove_line_noise(segments, sfreq, freqs=60):
+    """
+    Remove line noise from short segments by least-squares fitting of sinusoids.
+
+    A cosine and a sine at each frequency are fitted to every segment and channel at once 
+    and subtracted (the 'spectrum_fit' idea of MNE's notch filter). Unlike an IIR notch, 
+    this has no start-up transient, so short segments need no extra padding for it.
+
+    Parameters:
+    segments (numpy.ndarray): Signal with time along the last axis; modified in place.
+    sfreq (float): Sampling frequency of segments.
+    freqs (float or list, optional): Line noise frequencies in Hz. Default is 60 Hz.
+
+    Returns:
+    numpy.ndarray: segments, with the fitted sinusoids removed.
+    """
+    times = np.arange(segments.shape[-1]) / sfreq
+    phases = 2 * np.pi * np.outer(times, np.atleast_1d(freqs))
+    design = np.hstack((np.cos(phases), np.sin(phases)))  # (n_samples, 2 * n_freqs)
+    projection = np.linalg.pinv(design).T.astype(segments.dtype)
+    coefficients = segments @ projection
+    segments -= coefficients @ design.T.astype(segments.dtype)
+    return segments
+
+def blank_stimulus_artifact(data, event_index, samples_before, samples_after):
+    """
+    Blank the TMS pulse artifact around events and bridge it by linear interpolation.
+
+    The samples from samples_before before to samples_after after each event are replaced 
+    by a straight line between the last sample before and the first sample after the 
+    blanked window, for every segment, event and channel in one indexed array operation. 
+    Blanking before filtering keeps the filters from smearing the artifact into the MEP 
+    window.
+
+    Parameters:
+    data (numpy.ndarray): Segments shaped (n_segments, n_channels, n_samples), or a continuous 
+                          signal shaped (n_channels, n_samples); modified in place.
+    event_index (array-like): Stimulus samples of each segment, shaped (n_segments,) or 
+                              (n_segments, n_events) (repeat an event to pad a row), or of 
+                              every event in the continuous signal.
+    samples_before (int): Blanked samples before each event.
+    samples_after (int): Blanked samples from each event onwards.
+
+    Returns:
+    numpy.ndarray: data, with the artifact windows interpolated.
+
+    Raises:
+    ValueError: If a blanked window (with its two anchor samples) leaves the signal.
+    """
+    segments = data if data.ndim == 3 else data[np.newaxis]
+    event_index = np.asarray(event_index, dtype=np.int64).reshape(len(segments), -1)
+    left = event_index - samples_before - 1
+    right = event_index + samples_after
+    if event_index.size and (left.min() < 0 or right.max() >= segments.shape[-1]):
+        raise ValueError("Artifact blanking windows extend beyond the limits of the signal.")
+
+    # Blanked positions and their interpolation weights, shaped (n_segments, n_events * n_blank)
+    n_blank = samples_before + samples_after
+    blank_index = (left[..., np.newaxis] + np.arange(1, n_blank + 1)).reshape(len(segments), 1, -1)
+    weights = np.tile(np.arange(1, n_blank + 1) / (n_blank + 1), event_index.shape[-1]).astype(data.dtype)
+
+    left_values = np.take_along_axis(segments, left[:, np.newaxis, :], axis=-1).repeat(n_blank, axis=-1)
+    right_values = np.take_along_axis(segments, right[:, np.newaxis, :], axis=-1).repeat(n_blank, axis=-1)
+    np.put_along_axis(segments, blank_index, left_values + (right_values - left_values) * weights, axis=-1)
+    return data
+
+def _blank_samples(blank_ms, sfreq):
+    """Blanked samples (before, after) an event for a (before, after) window in ms."""
+    return tuple(int(np.ceil(ms * sfreq / 1000)) for ms in blank_ms)
+
+def _segment_stimulus_index(stimulus_samples, native_starts, n_native, blank_before, blank_after):
+    """
+    Native stimulus samples inside each segment, relative to the segment start.
+
+    Each row holds the stimuli whose blanking window lies within the segment, padded by 
+    repeating its first stimulus (blanking twice changes nothing). Also returns which 
+    segments hold at least one stimulus; the rows of the others are meaningless.
+    """
+    sorted_stimuli = np.sort(np.asarray(stimulus_samples, dtype=np.int64))
+    first = np.searchsorted(sorted_stimuli, native_starts + blank_before + 1)
+    last = np.searchsorted(sorted_stimuli, native_starts + n_native - blank_after, side='left')
+    n_inside = np.max(last - first, initial=1)
+    candidates = np.minimum(first[:, np.newaxis] + np.arange(n_inside), len(sorted_stimuli) - 1)
+    inside = candidates < last[:, np.newaxis]
+    stimulus_index = np.where(inside, sorted_stimuli[candidates], sorted_stimuli[candidates[:, :1]])
+    return stimulus_index - native_starts[:, np.newaxis], last > first
+
+def _blank_segments(segments, stimulus_samples, native_starts, blank_ms, sfreq):
+    """Blank the stimulus artifacts inside each segment (see blank_stimulus_artifact), in place."""
+    if stimulus_samples is None:
+        raise ValueError("blank_ms requires stimulus_samples, the native samples of the stimuli to blank.")
+    if len(stimulus_samples) == 0:
+        return segments
+    blank_before, blank_after = _blank_samples(blank_ms, sfreq)
+    stimulus_index, has_stimulus = _segment_stimulus_index(stimulus_samples, np.asarray(native_starts), 
+                                                           segments.shape[-1], blank_before, blank_after)
+    if has_stimulus.any():
+        segments[has_stimulus] = blank_stimulus_artifact(segments[has_stimulus], stimulus_index[has_stimulus], 
+                                                         blank_before, blank_after)
+    return segments
+
+def _event_segment_starts(event_samples, up, samples_before):
+    """First sample (at the new rate) of each event segment, aligned to the resampling grid."""
+    starts = np.asarray(event_samples, dtype=np.int64) - samples_before
+    return starts - starts % up
+
+def filter_event_segments(data, sfreq, event_samples, samples_before, samples_after, new_sfreq=3000, 
+                          notch_freqs=60, l_freq=20, h_freq=500, order=2, pad_samples=None, scales=None, 
+                          dtype=np.float64, blank_ms=None, stimulus_samples=None):
+    """
+    Filter and resample only padded segments around each event instead of the whole recording.
+
+    Each event gets a segment from samples_before before to samples_after after the event, 
+    plus pad_samples of padding on both sides so the filter start-up transients settle 
+    before the event window. The segments go through the steps of the full-recording 
+    chain (see preprocess_raw), all at once along the time axis: with blank_ms, the 
+    artifact of every stimulus in stimulus_samples that falls inside a segment is first 
+    blanked and interpolated (blank_stimulus_artifact) at its native sample; the segments 
+    are then resampled to new_sfreq by polyphase filtering, line noise is fitted and 
+    subtracted with remove_line_noise (in place of the notch, whose ringing would dictate 
+    seconds of padding) and the bandpass of apply_bandpass_filter is applied zero-phase, 
+    before cropping back to the event windows. Segment starts are aligned to the 
+    resampling grid, so the windows fall on the same samples as when the whole recording 
+    is resampled. Use validate_event_local to check the windows against the full mode, 
+    validate_event_padding to check the padding alone, and get_epoch_metrics for the MEP 
+    and RMS values. The windows approximate the full mode 
+    rather than reproduce it: the line noise fit and the polyphase resampling differ from 
+    the FIR notch and (by default) the FFT resampling of the full-recording chain.
+
+    Parameters:
+    data (array-like): Signal shaped (n_times, n_channels) at sfreq, e.g. the memory map 
+                       returned by import_signal.memmap_brainvision_data.
+    sfreq (float): Sampling frequency of data.
+    event_samples (array-like): Event positions at new_sfreq (as in the pipeline events arrays).
+    samples_before (int): Window samples before each event, at new_sfreq.
+    samples_after (int): Window samples from each event onwards, at new_sfreq.
+    new_sfreq (float, optional): Output sampling frequency. Default is 3000 Hz.
+    notch_freqs (float, list or None, optional): Line noise frequencies in Hz (None to keep 
+                                                the line noise). Default is 60 Hz.
+    l_freq, h_freq, order: Bandpass parameters, see get_filter_design.
+    pad_samples (int, optional): Padding on each side, at new_sfreq. Defaults to the settling 
+                                 time of the bandpass (iir_padding_samples) plus the reach of 
+                                 the resampling filter.
+    scales (array-like, optional): Per-channel factor converting data to volts (e.g. the 
+                                   'scales' of the BrainVision header). Default is 1.
+    dtype (numpy dtype, optional): Floating point type of the segments, the filtering and the 
+                                   returned windows (e.g. np.float32 for half the memory). 
+                                   Default is np.float64.
+    blank_ms (tuple, optional): Milliseconds (before, after) each stimulus to blank before 
+                                filtering. Default is None (no blanking).
+    stimulus_samples (array-like, optional): Native samples (at sfreq) of the stimuli to 
+                                             blank, e.g. the TMS pulse markers returned by 
+                                             import_signal.read_brainvision_markers. 
+                                             Required with blank_ms.
+
+    Returns:
+    numpy.ndarray: Filtered event windows shaped (n_events, n_channels, samples_before + samples_after).
+    """
+    up, down = resample_factors(sfreq, new_sfreq)
+    sos = get_filter_design(new_sfreq, l_freq, h_freq, order)['sos']
+    if pad_samples is None:
+        # Line noise is subtracted without a transient, so only the bandpass and the 
+        # resampling filter (10 * max(up, down) taps each side at the upsampled rate) need padding
+        pad_samples = iir_padding_samples(sos) + -(-10 * max(up, down) // down)
+
+    # Segment bounds on the resampling grid (new rate), then in native samples
+    starts = _event_segment_starts(event_samples, up, samples_before + pad_samples)
+    offsets = np.asarray(event_samples, dtype=np.int64) - starts
+    n_new = samples_before + samples_after + 2 * pad_samples + up
+    n_new += -n_new % up
+    native_starts = starts * down // up
+    n_native = n_new * down // up
+
+    if native_starts.size and (native_starts.min() < 0 or native_starts.max() + n_native > data.shape[0]):
+        raise ValueError("Padded event segments extend beyond the limits of the recording.")
+
+    segment_index = native_starts[:, np.newaxis] + np.arange(n_native)
+    segments = np.asarray(data[segment_index], dtype=dtype).transpose(0, 2, 1)
+    if scales is not None:
+        segments *= np.asarray(scales, dtype=dtype)[:, np.newaxis]
+
+    if blank_ms is not None:
+        _blank_segments(segments, stimulus_samples, native_starts, blank_ms, sfreq)
+    if up != down:
+        segments = signal.resample_poly(segments, up, down, axis=-1).astype(dtype, copy=False)
+    if notch_freqs is not None:
+        remove_line_noise(segments, new_sfreq, notch_freqs)
+    segments = signal.sosfiltfilt(sos.astype(dtype), segments, axis=-1)
+
+    window_index = offsets[:, np.newaxis] + np.arange(-samples_before, samples_after)
+    return np.take_along_axis(segments, window_index[:, np.newaxis, :], axis=-1)
+
+def validate_event_padding(data, sfreq, event_samples, samples_before, samples_after, rtol=0.01, n_check=20, 
+                           new_sfreq=3000, l_freq=20, h_freq=500, order=2, pad_samples=None, scales=None, 
+                           dtype=np.float64, blank_ms=None, stimulus_samples=None):
+    """
+    Check that the padding of event-local filtering keeps filter transients out of the windows.
+
+    The first n_check events are filtered with filter_event_segments and, as a reference, 
+    by running the same steps (preprocess_raw) over the whole stretch of recording that 
+    contains them, with several seconds of margin, so the only difference left is the 
+    start-up transient of the segments. Line noise removal is left out of both, since the 
+    least-squares fit of remove_line_noise has no transient. The error of each window is 
+    its largest absolute deviation relative to the peak amplitude of the reference window.
+
+    This only tests the padding, not the equivalence with the full mode: event-local 
+    windows differ from the full-recording chain by the line noise fit (the FIR notch of 
+    the full mode also removes the noise within about 1 Hz of each line frequency, several 
+    % of the peak of windows that hold only noise) and, for resample_method='fft', by the 
+    resampling filter (see preprocess_raw); validate_event_local checks those.
+
+    Parameters:
+    data, sfreq, event_samples, samples_before, samples_after: See filter_event_segments.
+    rtol (float, optional): Largest accepted relative error. Default is 0.01 (1%).
+    n_check (int, optional): Number of events to check. Default is 20.
+    Remaining parameters: See filter_event_segments.
+
+    Returns:
+    float: The largest relative error found.
+
+    Raises:
+    ValueError: If the relative error exceeds rtol.
+    """
+    event_samples = np.asarray(event_samples, dtype=np.int64)[:n_check]
+    local = filter_event_segments(data, sfreq, event_samples, samples_before, samples_after, new_sfreq, None, 
+                                  l_freq, h_freq, order, pad_samples, scales, dtype, blank_ms, 
+                                  stimulus_samples)
+
+    # Reference: the stretch containing the checked events, filtered as a whole
+    up, down = resample_factors(sfreq, new_sfreq)
+    margin = int(5 * new_sfreq)
+    start = max(_event_segment_starts(event_samples.min(), up, samples_before + margin), 0)
+    stop = min(event_samples.max() + samples_after + margin, data.shape[0] * up // down)
+    stretch = np.array(data[start * down // up : stop * down // up], dtype=np.float64).T
+    if scales is not None:
+        stretch *= np.asarray(scales)[:, np.newaxis]
+    if blank_ms is not None:
+        _blank_segments(stretch[np.newaxis], stimulus_samples, [start * down // up], blank_ms, sfreq)
+    raw = mne.io.RawArray(stretch, mne.create_info(len(stretch), sfreq, ch_types='eeg'), verbose=False)
+    stretch = preprocess_raw(raw, new_sfreq, None, l_freq, h_freq, order).get_data()
+
+    window_index = (event_samples - start)[:, np.newaxis] + np.arange(-samples_before, samples_after)
+    reference = stretch[:, window_index].transpose(1, 0, 2)
+
+    error = np.max(np.abs(local - reference), axis=-1) / np.max(np.abs(reference), axis=-1)
+    max_error = float(np.max(error))
+    if max_error > rtol:
+        raise ValueError(f"Event-local filtering deviates {max_error:.2%} from filtering the whole stretch "
+                         f"(tolerance {rtol:.2%}). Increase pad_samples.")
+    return max_error
+
+def validate_event_local(data, sfreq, event_samples, samples_before, samples_after, rtol=0.01, n_check=20, 
+                         new_sfreq=3000, notch_freqs=60, l_freq=20, h_freq=500, resample_method='fft', 
+                         pad_samples=None, scales=None, dtype=np.float64, blank_ms=None, stimulus_samples=None):
+    """
+    Check event-local filtering against the full-recording chain of the full mode.
+
+    The first n_check events are filtered with filter_event_segments and, as a reference, 
+    by the full-mode steps (downsample_data, notch_filter_data and apply_bandpass_filter) 
+    over the stretch of recording that contains them, with margins longer than the FIR 
+    notch. The comparison therefore covers every difference between the two modes: the 
+    line noise fit against the FIR notch, the polyphase against the FFT resampling and 
+    the segment padding. With blank_ms the stretch is blanked as the segments are, since 
+    the full mode does not blank. The error of each window is its largest absolute 
+    deviation relative to the peak amplitude of the reference window.
+
+    Parameters:
+    data, sfreq, event_samples, samples_before, samples_after: See filter_event_segments.
+    rtol (float, optional): Largest accepted relative error. Default is 0.01 (1%).
+    n_check (int, optional): Number of events to check. Default is 20.
+    resample_method (str, optional): Resampling of the full mode, see downsample_data 
+                                     ('polyphase' for the fused chain). Default is 'fft'.
+    Remaining parameters: See filter_event_segments.
+
+    Returns:
+    float: The largest relative error found.
+
+    Raises:
+    ValueError: If the relative error exceeds rtol.
+    """
+    event_samples = np.asarray(event_samples, dtype=np.int64)[:n_check]
+    local = filter_event_segments(data, sfreq, event_samples, samples_before, samples_after, new_sfreq, 
+                                  notch_freqs, l_freq, h_freq, 2, pad_samples, scales, dtype, blank_ms, 
+                                  stimulus_samples)
+
+    # Reference: the stretch containing the checked events, through the full-mode chain. The 
+    # margins cover the FIR notch (about 3.3 s on each side at 3 kHz) and the resampling edges
+    up, down = resample_factors(sfreq, new_sfreq)
+    margin = int(10 * new_sfreq)
+    start = max(_event_segment_starts(event_samples.min(), up, samples_before + margin), 0)
+    stop = min(event_samples.max() + samples_after + margin, data.shape[0] * up // down)
+    stop -= (stop - start) % up
+    stretch = np.array(data[start * down // up : stop * down // up], dtype=np.float64).T
+    if scales is not None:
+        stretch *= np.asarray(scales)[:, np.newaxis]
+    if blank_ms is not None:
+        _blank_segments(stretch[np.newaxis], stimulus_samples, [start * down // up], blank_ms, sfreq)
+    raw = mne.io.RawArray(stretch, mne.create_info(len(stretch), sfreq, ch_types='eeg'), verbose=False)
+    raw = downsample_data(raw, new_sfreq, method=resample_method)
+    if notch_freqs is not None:
+        raw = notch_filter_data(raw, freqs=notch_freqs)
+    stretch = apply_bandpass_filter(raw, l_freq=l_freq, h_freq=h_freq)
+
+    window_index = (event_samples - start)[:, np.newaxis] + np.arange(-samples_before, samples_after)
+    reference = stretch[:, window_index].transpose(1, 0, 2)
+
+    error = np.max(np.abs(local - reference), axis=-1) / np.max(np.abs(reference), axis=-1)
+    max_error = float(np.max(error))
+    if max_error > rtol:
+        raise ValueError(f"Event-local filtering deviates {max_error:.2%} from the full-mode chain "
+                         f"(tolerance {rtol:.2%}), so event_local does not reproduce the full mode on this "
+                         f"recording; use filter_mode = 'full'. Event segments are resampled by polyphase "
+                         f"filtering, which differs most from resample_method='fft' (validate_event_padding "
+                         f"tells whether the padding is the cause).")
+    return max_error
+
 # def split_events_into_blocks(events_from_annotations, event_id, sfreq=3000, block_duration_sec=60, min_block_length=10):
 #     """
 #     Splits events into blocks based on a specified event ID, including all events within each block, and returns separate arrays for each block.
@@ -128,16 +712,15 @@ def split_events_InOut_game(events_from_annot):
     other containing the remaining events.
 
     Parameters:
-    events_from_annot (ndarray): A numpy array of event annotations where each row 
-                                 contains event data with the marker information in 
-                                 the third column.
+    events_from_annot (ndarray): Event table (utils.create_event_table) with the marker 
+                                 information in the 'code' field.
 
     Returns:
-    tuple: A tuple containing two numpy arrays. The first array consists of rows where 
+    tuple: A tuple containing two event tables. The first array consists of rows where 
            the marker 'D4' is in consecutive events, and the second array contains the 
            remaining rows.
     """
-    marker_col = events_from_annot[:, 2]
+    marker_col = events_from_annot['code']
 
     # Create boolean masks for the conditions
     is_D4 = marker_col == 4
@@ -157,49 +740,86 @@ def split_events_InOut_game(events_from_annot):
 
     return events_from_annot_outGame, events_from_annot_inGame
 
-def calculate_response_times(events_D2, events_Gkg, data_filtered):
-    """Calculates response times and identifies Gx1 and Gx2."""
-    response_times = []
-    Gx1 = []
-    Gx2 = []
-
-    for event_D2 in events_D2[:, 0]:
-        future_events = events_Gkg[events_Gkg[:, 0].astype(int) > event_D2]
-        if future_events.size > 0:
-            next_event_time = int(future_events[0, 0])
-            next_event_name = future_events[0, 1]
-            response_time = (next_event_time - event_D2) / data_filtered.info['sfreq']
-            response_times.append(response_time)
-            Gx1.append(next_event_name)
-
-            further_events = future_events[1:]  # Events after the identified Gx1
-            if further_events.size > 0:
-                next_next_event_name = further_events[0, 1]
-                Gx2.append(next_next_event_name)
-            else:
-                Gx2.append(None)  # No further event found
-        else:
-            Gx1.append(None)  # No next event found
-            Gx2.append(None)  # No further event found
+def calculate_response_times(events_D2, events_Gkg, sfreq):
+    """
+    Calculates response times and identifies Gx1 and Gx2 for all D2 events at once.
+
+    The next (Gx1) and next-but-one (Gx2) goalkeeper events after each D2 event are found 
+    with a binary search on the sorted Gkg samples, instead of masking the Gkg events once 
+    per D2 event.
+
+    Parameters:
+    events_D2 (numpy.ndarray): Event table (utils.create_event_table) of the D2 events.
+    events_Gkg (numpy.ndarray): Event table of the Gkg events in time order, with the 
+                                alfabet field set (utils.set_event_alfabet).
+    sfreq (float): Sampling frequency of the event samples.
+
+    Returns:
+    tuple: Response times in s, Gx1 and Gx2 alfabet numbers, each a float numpy array with 
+           one entry per D2 event and NaN where no such Gkg event follows.
+    """
+    gkg_samples = events_Gkg['sample']
+
+    # Index of the first Gkg event strictly after each D2 event; a trailing NaN entry 
+    # stands for "no such event"
+    next_index = np.searchsorted(gkg_samples, events_D2['sample'], side='right')
+    padded_samples = np.append(gkg_samples, np.nan)
+    padded_alfabet = np.append(events_Gkg['alfabet'], np.nan)
+
+    response_times = (padded_samples[next_index] - events_D2['sample']) / sfreq
+    Gx1 = padded_alfabet[next_index]
+    Gx2 = padded_alfabet[np.minimum(next_index + 1, len(gkg_samples))]
 
     return response_times, Gx1, Gx2
 
 def analyze_choice(choice, sequence):
-    """Analyze the correctness of choices."""
+    """Analyze the correctness of choices (a missing choice or sequence entry, NaN, is incorrect)."""
     return ['correct' if i == j else 'incorrect' for i, j in zip(choice, sequence)]
 
 # def calculate_elapsed_time(events_from_annot_D1, data_filtered):
 #     """Calculate elapsed time in seconds at each trial marked by D1."""
 #     return [i / data_filtered.info['sfreq'] for i in events_from_annot_D1[:, 0]]
 
-def create_trigger_array(data_filtered):
-    """Create a trigger array with 12s where the events D4 are identified."""
-    events_from_annot_D4, event_dict_D4 = mne.events_from_annotations(data_filtered, regexp="Display/D  4")
-    events_D4 = events_from_annot_D4[:, 0]
-    trigger = np.zeros(data_filtered.n_times)
-    for i in events_D4:
-        trigger[i] = 12
-    return trigger
+def create_trigger_array(events_D4, n_times=None, value=12):
+    """
+    Create a sparse trigger with value (12) at the samples where the events D4 are identified.
+
+    Only the trigger samples are stored; use trigger_to_dense to get the dense trigger 
+    signal of a time range (e.g. for plotting or export).
+
+    Parameters:
+    events_D4 (numpy.ndarray): Samples of the D4 events (e.g. the 'sample' field of the 
+                               D4 events in the event table).
+    n_times (int, optional): Number of samples of the recording. If None, the dense 
+                             trigger ends at the last trigger sample.
+    value (float, optional): Trigger value at the event samples. Default is 12.
+
+    Returns:
+    dict: Sparse trigger with keys 'samples' (sorted int64 array), 'value' and 'n_times'.
+    """
+    samples = np.unique(np.asarray(events_D4, dtype=np.int64))
+    if n_times is None:
+        n_times = int(samples[-1]) + 1 if len(samples) else 0
+    return {'samples': samples[samples < n_times], 'value': value, 'n_times': n_times}
+
+def trigger_to_dense(trigger, start=0, stop=None):
+    """
+    Build the dense trigger signal of a time range from a sparse trigger.
+
+    Parameters:
+    trigger (dict): Sparse trigger as returned by create_trigger_array.
+    start (int, optional): First sample of the range. Default is 0.
+    stop (int, optional): Sample after the end of the range. Default is the end of the recording.
+
+    Returns:
+    numpy.ndarray: Trigger signal of length stop - start, zero except at the trigger samples.
+    """
+    stop = trigger['n_times'] if stop is None else stop
+    samples = trigger['samples']
+    samples = samples[np.searchsorted(samples, start):np.searchsorted(samples, stop)]
+    dense = np.zeros(max(stop - start, 0))
+    dense[samples - start] = trigger['value']
+    return dense
 
 # def split_d4_events(events, d4_event_id):
 #     """Split D4 events into D4_stim and D4_rest and remove the first 12 D4_stim events."""
@@ -399,23 +1019,341 @@ def rms_amplitude(input_signal):
     rms = np.sqrt(np.mean(input_signal**2, axis=0))
     return rms
 
+def build_rms_index(data, picks=None):
+    """
+    Build a cumulative sum-of-squares index of the signal for O(1) window RMS lookups.
+
+    The index is built once per channel; afterwards the RMS of any window, of any length and 
+    offset, is two lookups and a subtraction (see window_rms). It is always accumulated in 
+    float64.
+
+    Parameters:
+    data (numpy.ndarray): Signal shaped (n_channels, n_times), e.g. data_filtered._data.
+    picks (list, optional): Channel indices to index, in this order. Default is all channels.
+
+    Returns:
+    numpy.ndarray: Index shaped (n_picks, n_times + 1); column t holds the sum of squares of 
+                   the first t samples.
+    """
+    picks = range(len(data)) if picks is None else picks
+    index = np.zeros((len(picks), data.shape[-1] + 1))
+    for row, pick in zip(index, picks):
+        np.cumsum(np.square(data[pick], dtype=np.float64), out=row[1:])
+    return index
+
+def window_rms(rms_index, event_samples, start_offset, stop_offset=0):
+    """
+    RMS of the window [event + start_offset, event + stop_offset) of every event and channel.
+
+    Parameters:
+    rms_index (numpy.ndarray): Index as returned by build_rms_index.
+    event_samples (array-like): Event positions in samples.
+    start_offset (int or array-like): Window start relative to the event (e.g. 
+                                      -samples_before_rms). An array of offsets computes 
+                                      one window per offset.
+    stop_offset (int, optional): Window end (exclusive) relative to the event. Default is 0.
+
+    Returns:
+    numpy.ndarray: RMS values shaped (n_events, n_channels), or (n_offsets, n_events, 
+                   n_channels) for an array of start offsets.
+    """
+    event_samples = np.asarray(event_samples, dtype=np.int64)
+    starts = event_samples + np.asarray(start_offset, dtype=np.int64)[..., np.newaxis]
+    stops = event_samples + stop_offset
+    if starts.size and (starts.min() < 0 or stops.max() > rms_index.shape[-1] - 1):
+        raise ValueError("RMS windows extend beyond the limits of the recording.")
+
+    lengths = (stops - starts)[..., np.newaxis]
+    sum_squares = rms_index[:, stops].T - np.moveaxis(rms_index[:, starts], 0, -1)
+    return np.sqrt(np.maximum(sum_squares, 0) / lengths)
+
+def rms_exclusion_sweep(rms_index, event_samples, window_lengths, rms_thresh=2, groups=None):
+    """
+    Fraction of events excluded by the RMS criterion for several baseline window lengths.
+
+    For each length, the pre-stimulus RMS of every event is looked up in the index and the 
+    events above mean + rms_thresh * std (per channel and group) are counted as excluded, 
+    with the 'rms_sd' rule of exclude_outliers as in the RMS exclusion of the pipeline. All 
+    lengths go through one grouped pass, as extra columns.
+
+    Parameters:
+    rms_index (numpy.ndarray): Index as returned by build_rms_index.
+    event_samples (array-like): Event positions in samples.
+    window_lengths (array-like): Baseline window lengths in samples (windows end at the event).
+    rms_thresh (float, optional): Threshold in standard deviations. Default is 2.
+    groups (array-like or list, optional): Groups of the thresholds (e.g. block_info), as in 
+                                           exclude_outliers. Default is one group.
+
+    Returns:
+    numpy.ndarray: Excluded fraction shaped (n_lengths, n_channels).
+    """
+    rms = window_rms(rms_index, event_samples, -np.asarray(window_lengths, dtype=np.int64))
+    n_lengths, n_events, n_channels = rms.shape
+    columns = rms.transpose(1, 0, 2).reshape(n_events, n_lengths * n_channels)
+    mask = exclude_outliers(columns, 'rms_sd', groups=groups, k=rms_thresh)['mask']
+    return np.mean(mask.reshape(n_events, n_lengths, n_channels), axis=0)
+
+def sweep_epoch_metrics(data, event_samples, sfreq, time_before_stim, time_after_stim, time_before_rms, 
+                        delay_ms=(10,), picks=None, ch_names=None, n_jobs=1):
+    """
+    Peak-to-peak and RMS values of every event for a grid of MEP window and delay settings.
+
+    One superset epoch covering every setting is extracted per event. Peak-to-peak values 
+    come from running maxima/minima from each distinct window start (delay included), so all 
+    window ends sharing a start cost a single pass; RMS values come from a running sum of 
+    squares backwards from the event, so all baseline lengths cost a single pass. The 
+    distinct window starts are processed in parallel. For the settings of the pipeline the 
+    results equal get_epoch_metrics.
+
+    Parameters:
+    data (numpy.ndarray): Signal shaped (n_channels, n_times), e.g. data_filtered._data.
+    event_samples (array-like): Event positions in samples.
+    sfreq (float): Sampling frequency of data.
+    time_before_stim (list): Values of time_before_stim (s), start of the MEP window.
+    time_after_stim (list): Values of time_after_stim (s), end of the MEP window.
+    time_before_rms (list): Values of time_before_rms (s), length of the RMS baseline window.
+    delay_ms (list, optional): Values of the peak_to_peak_amplitude delay (ms). Default is [10].
+    picks (list, optional): Channel indices to process. Default is all channels.
+    ch_names (list, optional): Names of the picked channels for the table. Default is their indices.
+    n_jobs (int, optional): Number of threads. Default is 1.
+
+    Returns:
+    pandas.DataFrame: One row per setting, event and channel, with columns time_before_stim, 
+                      time_after_stim, time_before_rms, delay_ms, event, channel, p2p and rms 
+                      (in the units of data).
+    """
+    grid = list(itertools.product(time_before_stim, time_after_stim, time_before_rms, delay_ms))
+    p2p_windows = {}  # (start, stop) relative to the event -> grid points
+    rms_lengths = {}
+    for point in grid:
+        before_stim, after_stim, before_rms, delay = point
+        start = -int(before_stim * sfreq) + int(delay * (sfreq / 1000))
+        stop = int(after_stim * sfreq)
+        if start >= stop or int(before_rms * sfreq) < 1:
+            raise ValueError(f"Empty MEP or RMS window for setting {point}.")
+        p2p_windows[point] = (start, stop)
+        rms_lengths[point] = int(before_rms * sfreq)
+
+    # Superset epochs of all settings
+    samples_before = max(max(rms_lengths.values()), max(-start for start, _ in p2p_windows.values()), 0)
+    samples_after = max(max(stop for _, stop in p2p_windows.values()), 0)
+    epochs = extract_epochs(data, event_samples, samples_before, samples_after)
+    if picks is not None:
+        epochs = epochs[:, picks]
+
+    def running_p2p(start):
+        """Peak-to-peak of the windows from start to every later end (relative to the event)."""
+        segment = epochs[..., samples_before + start:]
+        return np.maximum.accumulate(segment, axis=-1) - np.minimum.accumulate(segment, axis=-1)
+
+    starts = sorted({start for start, _ in p2p_windows.values()})
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        running = dict(zip(starts, executor.map(running_p2p, starts)))
+    baseline_squares = np.cumsum(np.square(epochs[..., samples_before - 1::-1]), axis=-1)
+
+    p2p = np.stack([running[start][..., stop - start - 1] for start, stop in (p2p_windows[point] for point in grid)])
+    rms = np.stack([np.sqrt(baseline_squares[..., rms_lengths[point] - 1] / rms_lengths[point]) for point in grid])
+
+    # Tidy table: settings x events x channels
+    n_grid, n_events, n_channels = p2p.shape
+    settings = np.repeat(np.array(grid, dtype=float), n_events * n_channels, axis=0)
+    return pd.DataFrame({
+        'time_before_stim': settings[:, 0],
+        'time_after_stim': settings[:, 1],
+        'time_before_rms': settings[:, 2],
+        'delay_ms': settings[:, 3],
+        'event': np.tile(np.repeat(np.arange(n_events), n_channels), n_grid),
+        'channel': np.tile(ch_names if ch_names is not None else np.arange(n_channels), n_grid * n_events),
+        'p2p': p2p.ravel(),
+        'rms': rms.ravel()
+    })
+
+def extract_epochs(data, event_samples, samples_before, samples_after, dtype=None):
+    """
+    Build the event-locked epochs of all events and channels in one indexing operation.
+
+    A sliding-window view of the signal (no copy) is indexed at the window starts, so 
+    all windows are gathered at once instead of slicing each event in a loop.
+
+    Parameters:
+    data (numpy.ndarray): Signal shaped (n_channels, n_times), e.g. data_filtered._data.
+    event_samples (array-like): Event positions in samples.
+    samples_before (int): Samples before each event.
+    samples_after (int): Samples from each event onwards.
+    dtype (numpy dtype, optional): Floating point type of the epochs, e.g. np.float32. 
+                                   Default is the type of data.
+
+    Returns:
+    numpy.ndarray: Epochs shaped (n_events, n_channels, samples_before + samples_after), 
+                   with the event at index samples_before.
+    """
+    starts = np.asarray(event_samples, dtype=np.int64) - samples_before
+    n_samples = samples_before + samples_after
+    if starts.size and (starts.min() < 0 or starts.max() + n_samples > data.shape[-1]):
+        raise ValueError("Event windows extend beyond the limits of the recording.")
+
+    windows = np.lib.stride_tricks.sliding_window_view(data, n_samples, axis=-1)
+    epochs = windows[:, starts].transpose(1, 0, 2)
+    return epochs if dtype is None else epochs.astype(dtype)
+
+def get_epoch_metrics(epochs, samples_before_stim, samples_before_rms, delay_ms=10, sfreq=3000):
+    """
+    Compute peak-to-peak and RMS values of all epochs and channels with axis reductions.
+
+    Parameters:
+    epochs (numpy.ndarray): Epochs shaped (n_events, n_channels, n_samples) in which the event 
+                            is at index max(samples_before_stim, samples_before_rms), as 
+                            returned by extract_epochs or filter_event_segments.
+    samples_before_stim (int): Samples before the event in the peak-to-peak window.
+    samples_before_rms (int): Samples before the event in the RMS window.
+    delay_ms (float, optional): Delay of the peak-to-peak window start in ms (shorter once 
+                                the stimulus artifact is blanked). Default is 10 ms.
+    sfreq (float, optional): Sampling frequency of the epochs. Default is 3000 Hz.
+
+    Returns:
+    tuple: Peak-to-peak and RMS values, each shaped (n_events, n_channels).
+    """
+    event_index = max(samples_before_stim, samples_before_rms)
+    p2p = peak_to_peak_amplitude(epochs[:, :, event_index - samples_before_stim:].transpose(2, 0, 1), 
+                                 delay_ms=delay_ms, sampling_frequency=sfreq)
+    rms = rms_amplitude(epochs[:, :, event_index - samples_before_rms:event_index].transpose(2, 0, 1))
+    return p2p, rms
+
 def get_event_data_windows(data_filtered, events_D4, samples_before_stim, samples_after_stim, samples_before_rms):
-    """Extract data windows for peak-to-peak and RMS processing."""
-    p2p_1, p2p_2, rms_1, rms_2 = [], [], [], []
+    """Extract data windows for peak-to-peak and RMS processing of the first two channels."""
+    epochs = extract_epochs(data_filtered._data[:2], events_D4, max(samples_before_stim, samples_before_rms), 
+                            samples_after_stim)
+    p2p, rms = get_epoch_metrics(epochs, samples_before_stim, samples_before_rms)
+    return p2p[:, 0], p2p[:, 1], rms[:, 0], rms[:, 1]
+
+# MEP morphology metrics: name -> function(context) returning values shaped (n_events, n_channels).
+# The context is built once by compute_mep_metrics (see there); add entries to plug in new metrics.
+def _crossing_time(context, index):
+    """Time (ms) of the MEP sample at index, NaN for epochs without a threshold crossing."""
+    return np.where(context['has_mep'], context['times_ms'][index], np.nan)
+
+def mep_onset_latency(context):
+    """Latency (ms after the stimulus) of the first sample whose rectified EMG exceeds the threshold."""
+    return _crossing_time(context, context['onset_index'])
+
+def mep_offset_latency(context):
+    """Latency (ms after the stimulus) of the last sample whose rectified EMG exceeds the threshold."""
+    return _crossing_time(context, context['offset_index'])
+
+def mep_duration(context):
+    """Time (ms) from MEP onset to offset."""
+    return mep_offset_latency(context) - mep_onset_latency(context)
+
+def mep_rectified_area(context):
+    """Area (V*s) of the rectified EMG from MEP onset to offset."""
+    # Sum of |mep| over [onset, offset] from a cumulative sum with a leading zero
+    cumulative = np.cumsum(np.abs(context['mep']), axis=-1)
+    cumulative = np.concatenate((np.zeros(cumulative.shape[:-1] + (1,)), cumulative), axis=-1)
+    area = (np.take_along_axis(cumulative, context['offset_index'][..., np.newaxis] + 1, axis=-1) -
+            np.take_along_axis(cumulative, context['onset_index'][..., np.newaxis], axis=-1))[..., 0]
+    return np.where(context['has_mep'], area / context['sfreq'], np.nan)
+
+def mep_peak_to_peak(context):
+    """Peak-to-peak amplitude (V) of the MEP window, as peak_to_peak_amplitude."""
+    return np.max(context['mep'], axis=-1) - np.min(context['mep'], axis=-1)
+
+def mep_max_peak_latency(context):
+    """Latency (ms after the stimulus) of the positive peak."""
+    return context['times_ms'][np.argmax(context['mep'], axis=-1)]
+
+def mep_min_peak_latency(context):
+    """Latency (ms after the stimulus) of the negative peak."""
+    return context['times_ms'][np.argmin(context['mep'], axis=-1)]
+
+MEP_METRICS = {
+    'onset_latency_ms': mep_onset_latency,
+    'offset_latency_ms': mep_offset_latency,
+    'duration_ms': mep_duration,
+    'rectified_area_Vs': mep_rectified_area,
+    'peak_to_peak_V': mep_peak_to_peak,
+    'max_peak_latency_ms': mep_max_peak_latency,
+    'min_peak_latency_ms': mep_min_peak_latency
+}
+
+def compute_mep_metrics(epochs, sfreq, samples_before_stim, samples_before_rms, metrics=None, delay_ms=10, 
+                        onset_sd=3):
+    """
+    Compute MEP morphology metrics of all epochs and channels with array reductions.
+
+    The MEP window starts delay_ms after its start (as in peak_to_peak_amplitude) and the 
+    baseline is the RMS window before the event. A sample belongs to the MEP when its 
+    rectified value exceeds onset_sd standard deviations of the baseline of its epoch and 
+    channel. Each metric of MEP_METRICS is a function of a shared context dict with the keys 
+    'mep' and 'baseline' (windows shaped (n_events, n_channels, n_samples)), 'sfreq', 
+    'times_ms' (time of each MEP sample after the stimulus), 'threshold', 'above' (samples 
+    above threshold), 'has_mep' (epochs with at least one such sample) and 'onset_index' / 
+    'offset_index' (first and last MEP sample above threshold, 0 without MEP).
+
+    Parameters:
+    epochs (numpy.ndarray): Epochs as for get_epoch_metrics.
+    sfreq (float): Sampling frequency of the epochs.
+    samples_before_stim (int): Samples before the event in the MEP window.
+    samples_before_rms (int): Samples before the event in the baseline window.
+    metrics (list, optional): Names of the MEP_METRICS to compute. Default is all.
+    delay_ms (float, optional): Delay of the MEP window start in ms. Default is 10 ms.
+    onset_sd (float, optional): Threshold in baseline standard deviations. Default is 3.
 
-    for i in range(len(events_D4)):
-        win_1 = data_filtered._data[0][events_D4[i] - samples_before_stim : events_D4[i] + samples_after_stim]
-        win_2 = data_filtered._data[1][events_D4[i] - samples_before_stim : events_D4[i] + samples_after_stim]
+    Returns:
+    dict: Metric name to values shaped (n_events, n_channels) (NaN for latencies, duration 
+          and area of epochs without MEP).
+    """
+    event_index = max(samples_before_stim, samples_before_rms)
+    start = event_index - samples_before_stim + int(delay_ms * (sfreq / 1000))
+    baseline = epochs[:, :, event_index - samples_before_rms:event_index]
+    context = {
+        'mep': np.ascontiguousarray(epochs[:, :, start:]),
+        'baseline': baseline,
+        'sfreq': sfreq,
+        'times_ms': (np.arange(start, epochs.shape[-1]) - event_index) * 1000 / sfreq
+    }
+
+    # Baseline SD from the first two moments (one pass, no centered copy of the baseline)
+    mean = np.mean(baseline, axis=-1)
+    mean_square = np.einsum('ijk,ijk->ij', baseline, baseline) / baseline.shape[-1]
+    context['threshold'] = onset_sd * np.sqrt(np.maximum(mean_square - mean**2, 0))[..., np.newaxis]
+
+    above = np.abs(context['mep']) > context['threshold']
+    context['above'] = above
+    context['has_mep'] = np.any(above, axis=-1)
+    context['onset_index'] = np.argmax(above, axis=-1)
+    context['offset_index'] = above.shape[-1] - 1 - np.argmax(above[..., ::-1], axis=-1)
+    return {name: MEP_METRICS[name](context) for name in (metrics if metrics is not None else MEP_METRICS)}
+
+def validate_epoch_dtype(epochs, reference_epochs, samples_before_stim, samples_before_rms, rtol=1e-3, 
+                         delay_ms=10, sfreq=3000, atol=1e-12):
+    """
+    Check the MEP peak-to-peak values of reduced-precision epochs against a float64 reference.
 
-        rms_win_1 = data_filtered._data[0][events_D4[i] - samples_before_rms : events_D4[i]]
-        rms_win_2 = data_filtered._data[1][events_D4[i] - samples_before_rms : events_D4[i]]
+    Parameters:
+    epochs (numpy.ndarray): Epochs computed in reduced precision (e.g. float32), shaped 
+                            (n_events, n_channels, n_samples).
+    reference_epochs (numpy.ndarray): The same epochs computed in float64.
+    samples_before_stim, samples_before_rms, delay_ms, sfreq: See get_epoch_metrics (use the 
+                                                              values of the exported metrics).
+    rtol (float, optional): Largest accepted relative error of the peak-to-peak values. 
+                            Default is 1e-3 (0.1%).
+    atol (float, optional): Smallest peak-to-peak value (V) errors are relative to, so flat or 
+                            blanked channels do not divide by zero. Default is 1e-12.
 
-        p2p_1.append(peak_to_peak_amplitude(win_1))
-        p2p_2.append(peak_to_peak_amplitude(win_2))
-        rms_1.append(rms_amplitude(rms_win_1))
-        rms_2.append(rms_amplitude(rms_win_2))
+    Returns:
+    float: The largest relative error found.
 
-    return np.array(p2p_1), np.array(p2p_2), np.array(rms_1), np.array(rms_2)
+    Raises:
+    ValueError: If the relative error exceeds rtol or is not finite.
+    """
+    p2p, _ = get_epoch_metrics(epochs, samples_before_stim, samples_before_rms, delay_ms, sfreq)
+    p2p_reference, _ = get_epoch_metrics(reference_epochs, samples_before_stim, samples_before_rms, delay_ms, sfreq)
+    error = np.abs(p2p.astype(np.float64) - p2p_reference) / np.maximum(np.abs(p2p_reference), atol)
+    max_error = float(np.max(error, initial=0))
+    if not max_error <= rtol:
+        raise ValueError(f"MEP peak-to-peak values in {epochs.dtype} deviate {max_error:.2e} from float64 "
+                         f"(tolerance {rtol:.0e}).")
+    return max_error
 
 def exclude_mep_rms(data, rms_values, rms_threshold):
     """
@@ -433,8 +1371,9 @@ def exclude_mep_rms(data, rms_values, rms_threshold):
         A 1D or 2D array containing the RMS values corresponding to the MEP data. 
         This array should have the same shape as `data`.
 
-    rms_threshold : float
+    rms_threshold : float or numpy.ndarray
         The threshold value above which RMS values will trigger exclusion in the MEP data.
+        For 2D data, one threshold per column (channel) can be given.
 
     symbolic_value : int, optional
         The value to assign to elements in `data` where the corresponding RMS values 
@@ -492,7 +1431,8 @@ def normalize_mep_by_mean(array1, array2):
     of valid values based on specific rules.
 
     Parameters:
-    array1 (np.ndarray): The first array containing numerical values.
+    array1 (np.ndarray): The first array containing numerical values. If 2D, shaped 
+                         (n_events, n_channels) and each channel is normalized by its own mean.
     array2 (np.ndarray): The second array containing values from 0 to 6.
 
     Returns:
@@ -503,17 +1443,14 @@ def normalize_mep_by_mean(array1, array2):
     # Create a mask for values < 5000 in array1
     mask = (array1 < 5000)
     
-    # Create a mask for values in array2 that are either 2, 4, or 6
-    filter_mask = np.isin(array2, [2, 4, 6])
+    # Create a mask for values in array2 that are either 2, 4, or 6 (one row per event)
+    filter_mask = np.isin(array2, [2, 4, 6]).reshape((-1,) + (1,) * (array1.ndim - 1))
     
     # Combine masks to get valid indices
     valid_indices = mask & filter_mask
     
-    # Get the filtered values from array1
-    filtered_values = array1[valid_indices]
-    
-    # Calculate the mean of the filtered values
-    mean_value = np.mean(filtered_values)
+    # Calculate the mean of the valid values (per channel)
+    mean_value = np.mean(array1, axis=0, where=valid_indices)
         
     # Create array3 by dividing each value in array1 by the mean
     array3 = array1 / mean_value
@@ -572,7 +1509,8 @@ def remove_outliers_by_index(data, index_array):
     using the IQR method.
     
     Parameters:
-    data (array-like): Array containing the values
+    data (array-like): Array containing the values. If 2D, shaped (n_events, n_channels) 
+                       and the IQR bounds are computed per channel.
     index_array (array-like): Array containing index values
     
     Returns:
@@ -589,9 +1527,9 @@ def remove_outliers_by_index(data, index_array):
     values_to_process = data[target_indices]
     
     if len(values_to_process) > 0:  # Only proceed if we have values to process
-        # Calculate Q1, Q3 and IQR for the selected values
-        Q1 = np.percentile(values_to_process, 25)
-        Q3 = np.percentile(values_to_process, 75)
+        # Calculate Q1, Q3 and IQR for the selected values (per channel)
+        Q1 = np.percentile(values_to_process, 25, axis=0)
+        Q3 = np.percentile(values_to_process, 75, axis=0)
         IQR = Q3 - Q1
         
         # Define bounds
@@ -602,9 +1540,257 @@ def remove_outliers_by_index(data, index_array):
         result = data.copy()
         
         # Replace outliers with nan only for the specified indices
+        target_indices = target_indices.reshape((-1,) + (1,) * (data.ndim - 1))
         mask = target_indices & ((data < lower_bound) | (data > upper_bound))
         result[mask] = np.nan
         
         return result
     
-    return data  # Return original data if no values to process
\ No newline at end of file
+    return data  # Return original data if no values to process
+
+def _row_group_codes(groups, n_rows):
+    """
+    Integer group code of each row and the label of each group.
+
+    groups is None (one group), one label array or a list of label arrays (e.g. volunteer 
+    and block) whose combinations make the groups.
+    """
+    if groups is None:
+        return np.zeros(n_rows, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    if not isinstance(groups, (list, tuple)):
+        group_labels, codes = np.unique(np.asarray(groups), return_inverse=True)
+        return codes.reshape(-1).astype(np.int64), group_labels
+
+    # Codes of each label array combined into one integer per row, then made consecutive
+    labels, codes = zip(*(np.unique(np.asarray(group), return_inverse=True) for group in groups))
+    dims = [len(label) for label in labels]
+    combined, codes = np.unique(np.ravel_multi_index([code.reshape(-1) for code in codes], dims), 
+                                return_inverse=True)
+    group_labels = np.rec.fromarrays([label[index] for label, index in zip(labels, np.unravel_index(combined, dims))])
+    return codes.reshape(-1).astype(np.int64), group_labels
+
+def _grouped_sort(values, codes, n_groups):
+    """
+    Sort every column of values by group, then by value (NaN last within each group).
+
+    Rows with code n_groups form an extra group that is left out of the statistics. 
+    Returns the context used by the exclusion rules: 'sorted' values shaped (n_rows, 
+    n_columns), 'row_group' (group of each sorted row), 'starts' and 'counts' (first 
+    sorted row and number of valid values of each group, per column).
+    """
+    order = np.argsort(values, axis=0, kind='stable')
+    order = np.take_along_axis(order, np.argsort(codes[order], axis=0, kind='stable'), axis=0)
+    sorted_values = np.take_along_axis(values, order, axis=0)
+
+    sizes = np.bincount(codes, minlength=n_groups + 1)
+    starts = np.concatenate(([0], np.cumsum(sizes)))
+    valid = np.concatenate((np.zeros((1, values.shape[1]), dtype=np.int64), 
+                            np.cumsum(~np.isnan(sorted_values), axis=0)))
+    return {
+        'sorted': sorted_values,
+        'row_group': np.repeat(np.arange(n_groups + 1), sizes),
+        'starts': starts[:n_groups],
+        'counts': valid[starts[1:n_groups + 1]] - valid[starts[:n_groups]]
+    }
+
+def _grouped_sum(context, values):
+    """Per-group sum of values laid out as context['sorted'] (NaN ignored), shaped (n_groups, n_columns)."""
+    cumulative = np.concatenate((np.zeros((1, values.shape[1])), np.cumsum(np.nan_to_num(values), axis=0)))
+    starts, columns = context['starts'][:, np.newaxis], np.arange(values.shape[1])
+    return cumulative[starts + context['counts'], columns] - cumulative[starts, columns]
+
+def _grouped_quantile(context, q):
+    """Per-group q-quantile (linear interpolation, as np.percentile), NaN for empty groups."""
+    counts = context['counts']
+    position = q * np.maximum(counts - 1, 0)
+    below = np.floor(position).astype(np.int64)
+    last_row = len(context['sorted']) - 1
+    index = np.minimum(context['starts'][:, np.newaxis] + below, last_row)
+    lower = np.take_along_axis(context['sorted'], index, axis=0)
+    upper = np.take_along_axis(context['sorted'], np.minimum(index + (below < counts - 1), last_row), axis=0)
+    return np.where(counts > 0, lower + (upper - lower) * (position - below), np.nan)
+
+def _grouped_mean_std(context):
+    """Per-group mean and (population) standard deviation, NaN for empty groups."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = _grouped_sum(context, context['sorted']) / context['counts']
+        mean_rows = np.concatenate((mean, np.full((1, mean.shape[1]), np.nan)))[context['row_group']]
+        variance = _grouped_sum(context, (context['sorted'] - mean_rows)**2) / context['counts']
+    return mean, np.sqrt(variance)
+
+def rms_sd_bounds(context, k=2):
+    """Exclude values above the group mean + k standard deviations (as the RMS criterion)."""
+    mean, std = _grouped_mean_std(context)
+    return np.full_like(mean, -np.inf), mean + k * std
+
+def iqr_bounds(context, k=1.5):
+    """Exclude values more than k interquartile ranges outside the group quartiles."""
+    q1, q3 = _grouped_quantile(context, 0.25), _grouped_quantile(context, 0.75)
+    return q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+
+def mad_bounds(context, k=3.5):
+    """Exclude values whose robust z-score (median and scaled MAD of the group) exceeds k."""
+    median = _grouped_quantile(context, 0.5)
+    n_groups = len(median)
+    median_rows = np.concatenate((median, np.full((1, median.shape[1]), np.nan)))[context['row_group']]
+    deviations = _grouped_sort(np.abs(context['sorted'] - median_rows), context['row_group'], n_groups)
+    mad = 1.4826 * _grouped_quantile(deviations, 0.5)
+    return median - k * mad, median + k * mad
+
+# Exclusion rules: name -> function(context, k) returning (lower, upper) bounds per group and 
+# column. The context is built by _grouped_sort; add entries to plug in new rules.
+EXCLUSION_RULES = {
+    'rms_sd': rms_sd_bounds,
+    'iqr': iqr_bounds,
+    'mad': mad_bounds
+}
+
+def exclude_outliers(values, rule='iqr', groups=None, k=None, reference=None):
+    """
+    Find outliers of every column within groups of rows with grouped vectorized reductions.
+
+    The bounds of each group and column are computed by one rule of EXCLUSION_RULES from 
+    the valid (non-NaN) values of the group, all groups at once from a single grouped 
+    sort. values is only read: the result is a mask, so the same values can be excluded 
+    with np.where(mask, np.nan, values) or masks of several rules combined with 
+    combine_exclusions.
+
+    Parameters:
+    values (numpy.ndarray): Values shaped (n_rows,) or (n_rows, n_columns), e.g. RMS or MEP 
+                            values with one column per muscle. NaN values are never excluded.
+    rule (str, optional): Name of the rule in EXCLUSION_RULES ('rms_sd', 'iqr' or 'mad'). 
+                          Default is 'iqr'.
+    groups (array-like or list, optional): Group label of each row (e.g. block_info or the 
+                                           volunteer), or a list of label arrays whose 
+                                           combinations are the groups. Default is one group.
+    k (float, optional): Rule multiplier. Defaults to the rule's own (2 SD, 1.5 IQR, 3.5 MAD).
+    reference (array-like, optional): Boolean mask of the rows that enter the statistics 
+                                      and can be excluded (e.g. the pulse blocks). Default 
+                                      is all rows.
+
+    Returns:
+    dict: 'mask' (True where excluded, shaped as values), 'lower' and 'upper' (bounds shaped 
+          (n_groups, n_columns)), 'codes' (group index of each row) and 'groups' (label of 
+          each group).
+    """
+    values = np.asarray(values)
+    columns = values.reshape(len(values), -1)
+    codes, group_labels = _row_group_codes(groups, len(values))
+    n_groups = len(group_labels)
+    if reference is not None:
+        reference = np.asarray(reference, dtype=bool)
+        context = _grouped_sort(columns, np.where(reference, codes, n_groups), n_groups)
+    else:
+        context = _grouped_sort(columns, codes, n_groups)
+
+    lower, upper = EXCLUSION_RULES[rule](context) if k is None else EXCLUSION_RULES[rule](context, k)
+    mask = (columns < lower[codes]) | (columns > upper[codes])
+    if reference is not None:
+        mask &= reference[:, np.newaxis]
+    return {'mask': mask.reshape(values.shape), 'lower': lower, 'upper': upper, 'codes': codes, 
+            'groups': group_labels}
+
+def combine_exclusions(exclusions):
+    """
+    Combine the masks of several exclusion rules and record why each value was excluded.
+
+    Parameters:
+    exclusions (dict): Reason name -> result of exclude_outliers (masks of the same shape).
+
+    Returns:
+    tuple: Combined mask (True where any rule excludes), the reason of each value as an 
+           int8 array (0 kept, i the i-th reason, the first one that applies) and the list 
+           of reason names (index 0 is 'kept').
+    """
+    names = ['kept'] + list(exclusions)
+    masks = np.stack([exclusion['mask'] for exclusion in exclusions.values()])
+    excluded = np.any(masks, axis=0)
+    reason = np.where(excluded, np.argmax(masks, axis=0) + 1, 0).astype(np.int8)
+    return excluded, reason, names
+
+def exclude_cohort_outliers(df, value_columns, rule='iqr', group_columns=('ID_info',), k=None, 
+                            reference=None, missing_value=99999):
+    """
+    Find outliers in a cohort table (e.g. the GKlab tables of all volunteers concatenated) in one call.
+
+    Parameters:
+    df (pandas.DataFrame): Cohort table with one row per trial.
+    value_columns (list): Columns to check, e.g. ['MEPpp_FDI_µV', 'MEPpp_FDS_µV'].
+    rule, k: See exclude_outliers.
+    group_columns (list, optional): Columns whose combinations make the groups, e.g. 
+                                    ['ID_info'] (per volunteer) or ['ID_info', 'block_info'] 
+                                    (per volunteer and block). Default is per volunteer.
+    reference (array-like, optional): See exclude_outliers, e.g. 
+                                      df['block_info'].isin([2, 4, 6]).to_numpy().
+    missing_value (float, optional): Symbolic value of missing data in the table (as written 
+                                     by utils.fill_missing_with_symbolic_value). Default is 99999.
+
+    Returns:
+    dict: As exclude_outliers, with 'mask' as a DataFrame of value_columns aligned with df.
+    """
+    values = df[list(value_columns)].to_numpy(dtype=float, copy=True)
+    if missing_value is not None:
+        values[values == missing_value] = np.nan
+    groups = [df[column].to_numpy() for column in group_columns] if group_columns else None
+    exclusion = exclude_outliers(values, rule, groups, k, reference)
+    exclusion['mask'] = pd.DataFrame(exclusion['mask'], index=df.index, columns=list(value_columns))
+    return exclusion
+
+def rms_threshold_sensitivity(mep, rms_values, thresholds, block_info, groups=None, rest_mean=None, 
+                              ref_blocks=(2, 4, 6), max_mep=5000):
+    """
+    Evaluate the RMS exclusion for a whole grid of thresholds at once.
+
+    The RMS mean and standard deviation of each group are computed once; the exclusion 
+    masks of all thresholds then follow by broadcasting, and the counts and MEP sums per 
+    block by one matrix product with the block indicator matrix. The normalized MEP means 
+    follow normalize_mep_by_mean (mean of the kept MEPs below max_mep in ref_blocks) and, 
+    with rest_mean, the normalization by rest.
+
+    Parameters:
+    mep (numpy.ndarray): MEP amplitudes in µV shaped (n_events, n_channels).
+    rms_values (numpy.ndarray): Pre-stimulus RMS values shaped (n_events, n_channels).
+    thresholds (array-like): RMS thresholds in standard deviations, e.g. np.arange(1.5, 4.05, 0.1).
+    block_info (array-like): Block of each event.
+    groups (array-like, optional): Groups of the RMS statistics as in exclude_outliers 
+                                   (e.g. block_info for per-block thresholds). Default is 
+                                   the whole session.
+    rest_mean (numpy.ndarray, optional): Mean MEP out of game per channel (µV).
+    ref_blocks (tuple, optional): Blocks of the mean used by the normalization. Default is (2, 4, 6).
+    max_mep (float, optional): MEPs from this value on are left out of the normalization mean. 
+                               Default is 5000 µV.
+
+    Returns:
+    dict: 'thresholds', 'blocks' (block labels), 'mask' (n_thresholds, n_events, n_channels), 
+          'excluded' (excluded counts, n_thresholds x n_blocks x n_channels), 'kept' (kept 
+          counts, same shape), 'relMean' (block means of the MEPs normalized by their mean) 
+          and, with rest_mean, 'relRest' (block means normalized by rest).
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    codes, group_labels = _row_group_codes(groups, len(rms_values))
+    mean, std = _grouped_mean_std(_grouped_sort(rms_values, codes, len(group_labels)))
+    mask = rms_values > mean[codes] + thresholds[:, np.newaxis, np.newaxis] * std[codes]
+
+    # Block indicator matrix (n_blocks, n_events): sums per block are matrix products
+    blocks, block_codes = np.unique(np.asarray(block_info), return_inverse=True)
+    indicator = (block_codes.reshape(-1) == np.arange(len(blocks))[:, np.newaxis]).astype(float)
+    kept = ~mask & ~np.isnan(mep)
+    kept_mep = np.where(kept, mep, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        block_means = (indicator @ kept_mep) / (indicator @ kept)
+
+        # Normalization mean of each threshold and channel, as in normalize_mep_by_mean
+        reference = np.isin(np.asarray(block_info), ref_blocks)[:, np.newaxis] & (mep < max_mep)
+        normalization = np.sum(kept_mep * reference, axis=1) / np.sum(kept & reference, axis=1)
+
+    sensitivity = {
+        'thresholds': thresholds,
+        'blocks': blocks,
+        'mask': mask,
+        'excluded': (indicator @ mask).astype(np.int64),
+        'kept': (indicator @ kept).astype(np.int64),
+        'relMean': block_means / normalization[:, np.newaxis, :]
+    }
+    if rest_mean is not None:
+        sensitivity['relRest'] = block_means / np.asarray(rest_mean)
+    return sensitivity
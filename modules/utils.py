@@ -37,25 +37,81 @@ def add_annotations_to_filtered(raw_filtered, raw_notch):
 #     """Extracts events from annotations based on a regular expression."""
 #     return mne.events_from_annotations(data_filtered, regexp=regexp)
 
-def extract_events_from_annot(events_from_annot, event_ID):
-    """Extracts events from annotations based on a regular expression."""
-    # Count how many rows will meet the condition to initialize the filtered array
-    event_ID_rows = np.sum(events_from_annot[:, 2] == event_ID)
-    
-    # Initialize a 2D array for the results
-    events = np.zeros((event_ID_rows, 2), dtype=int)  # 2 columns for the first and third values
-    
-    # Index to keep track of the filtered array position
-    index = 0
-
-    for row in events_from_annot:
-        if row[2] == event_ID:
-            # Store the values from the first and third columns in the 2D array
-            events[index] = [int(row[0]), int(row[2])]
-            index += 1  # Move to the next position in the filtered array
-    
+# Structured event table: one row per marker, in time order
+EVENT_DTYPE = np.dtype([('sample', np.int64), ('code', np.int16), ('alfabet', np.int8)])
+
+def create_event_table(samples, codes):
+    """
+    Creates a structured event table from marker samples and integer event codes.
+
+    Parameters:
+    samples (array-like): Sample index of each event.
+    codes (array-like): Integer event code of each event (as in mne.events_from_annotations).
+
+    Returns:
+    numpy.ndarray: Structured array with EVENT_DTYPE fields 'sample', 'code' and 'alfabet'.
+                   The alfabet field is -1 until set with set_event_alfabet.
+    """
+    events = np.empty(len(samples), dtype=EVENT_DTYPE)
+    events['sample'] = samples
+    events['code'] = codes
+    events['alfabet'] = -1
     return events
 
+def set_event_alfabet(events, event_dict, alfabet):
+    """
+    Fills the alfabet field of an event table in place from the marker names.
+
+    Parameters:
+    events (numpy.ndarray): Event table as returned by create_event_table.
+    event_dict (dict): Marker name to event code, as returned by import_brainvision_events.
+    alfabet (dict): Marker name to alfabet number, e.g. {'Gkg/G  2': 0, ...}.
+                    Events of other markers keep -1.
+
+    Returns:
+    numpy.ndarray: The same event table.
+    """
+    lookup = np.full(max(event_dict.values()) + 1, -1, dtype=np.int8)
+    for name, number in alfabet.items():
+        if name in event_dict:
+            lookup[event_dict[name]] = number
+    events['alfabet'] = lookup[events['code']]
+    return events
+
+def partition_events_by_code(events):
+    """
+    Splits an event table by event code in a single stable sort.
+
+    The table is reordered by code once (events of the same code stay in time order), and 
+    each code gets a contiguous slice of that copy, so the returned tables are views and 
+    no per-code copies or Python loops over events are made.
+
+    Parameters:
+    events (numpy.ndarray): Event table as returned by create_event_table.
+
+    Returns:
+    dict: Event code to the event table (view) of its events, in time order.
+    """
+    events_by_code = events[np.argsort(events['code'], kind='stable')]
+    codes, starts = np.unique(events_by_code['code'], return_index=True)
+    stops = np.append(starts[1:], len(events_by_code))
+    return {code: events_by_code[start:stop] for code, start, stop in zip(codes.tolist(), starts, stops)}
+
+def select_events(event_parts, codes):
+    """
+    Merges the events of several codes back into one table in time order.
+
+    Parameters:
+    event_parts (dict): Event tables per code, as returned by partition_events_by_code.
+    codes (list): Event codes to merge. Codes without events are ignored.
+
+    Returns:
+    numpy.ndarray: Event table with the events of all given codes, sorted by sample.
+    """
+    events = np.concatenate([event_parts[code] for code in codes if code in event_parts] +
+                            [np.empty(0, dtype=EVENT_DTYPE)])
+    return events[np.argsort(events['sample'], kind='stable')]
+
 # def create_block_info(play_info_length, n_blocks=6):
 #     # Example length of play_info
 #     """
@@ -113,26 +169,6 @@ def extract_events_from_annot(events_from_annot, event_ID):
 #     return result
 
 
-def combine_gkg_events(events_from_annot_G2, events_from_annot_G4, events_from_annot_G8):
-    """
-    Combine Gkg events from different annotations.
-    
-    Parameters:
-    events_from_annot_G2 (numpy array): Events from annotation G2
-    events_from_annot_G4 (numpy array): Events from annotation G4
-    events_from_annot_G8 (numpy array): Events from annotation G8
-    
-    Returns:
-    events_Gkg (numpy array): Combined Gkg events
-    """
-    events_Gkg = np.concatenate([
-        np.column_stack((events_from_annot_G2[:, 0], np.full(events_from_annot_G2.shape[0], 'Gkg/G  2'))),
-        np.column_stack((events_from_annot_G4[:, 0], np.full(events_from_annot_G4.shape[0], 'Gkg/G  4'))),
-        np.column_stack((events_from_annot_G8[:, 0], np.full(events_from_annot_G8.shape[0], 'Gkg/G  8')))
-    ], axis=0)
-    events_Gkg = events_Gkg[np.argsort(events_Gkg[:, 0].astype(int))]  # Sort by event time
-    return events_Gkg
-      
 def convert_to_alfabet(Gx, alfabet):
     """Convert code names to alfabet numbers."""
     return [alfabet.get(i, None) for i in Gx]
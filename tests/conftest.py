@@ -0,0 +1,49 @@
+"""
+Shared fixtures: a small synthetic BrainVision recording with the markers of the game.
+"""
+import numpy as np
+import pytest
+
+SFREQ = 5000
+GKG_MARKERS = ['G  2', 'G  4', 'G  8']
+
+def write_brainvision(folder, data, markers, sfreq=SFREQ, resolution=0.1):
+    """
+    Writes data (n_times, n_channels, in µV) and markers [(type, description, sample), ...]
+    as a BrainVision recording (INT_16, multiplexed) and returns the path of its '.vhdr' file.
+    """
+    np.round(data / resolution).clip(-32768, 32767).astype('<i2').tofile(folder / 'test.eeg')
+    channels = '\n'.join(f'Ch{ch}=EMG{ch},,{resolution},µV' for ch in range(1, data.shape[1] + 1))
+    (folder / 'test.vhdr').write_text(
+        'Brain Vision Data Exchange Header File Version 1.0\n\n[Common Infos]\nCodepage=UTF-8\n'
+        'DataFile=test.eeg\nMarkerFile=test.vmrk\nDataFormat=BINARY\nDataOrientation=MULTIPLEXED\n'
+        f'NumberOfChannels={data.shape[1]}\nSamplingInterval={1e6 / sfreq:g}\n\n'
+        f'[Binary Infos]\nBinaryFormat=INT_16\n\n[Channel Infos]\n{channels}\n', encoding='utf-8')
+    lines = ['Brain Vision Data Exchange Marker File, Version 1.0', '', '[Common Infos]', 'Codepage=UTF-8',
+             'DataFile=test.eeg', '', '[Marker Infos]', 'Mk1=New Segment,,1,1,0,20240101120000000000']
+    lines += [f'Mk{i}={kind},{description},{sample + 1},1,0' for i, (kind, description, sample) 
+              in enumerate(markers, start=2)]
+    (folder / 'test.vmrk').write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return folder / 'test.vhdr'
+
+@pytest.fixture
+def game_recording(tmp_path):
+    """
+    A 5 kHz, 2-channel recording with 4 rest D4 pulses followed by 12 game trials (D1, D4,
+    D2, two Gkg answers, D3, D5). The last trial has no Gkg answers.
+    """
+    rng = np.random.default_rng(0)
+    markers, sample = [], SFREQ
+    for _ in range(4):
+        markers.append(('Display', 'D  4', sample))
+        sample += int(0.35 * SFREQ)
+    for trial in range(12):
+        markers += [('Display', 'D  1', sample), ('Display', 'D  4', sample + 1499), 
+                    ('Display', 'D  2', sample + 2501)]
+        if trial < 11:
+            markers += [('Gkg', GKG_MARKERS[rng.integers(3)], sample + 4502 + rng.integers(100)), 
+                        ('Gkg', GKG_MARKERS[rng.integers(3)], sample + 5003)]
+        markers += [('Display', 'D  3', sample + 6000), ('Display', 'D  5', sample + 6500)]
+        sample += 8000
+    data = rng.normal(0, 20, (sample + SFREQ, 2))
+    return write_brainvision(tmp_path, data, markers)
@@ -0,0 +1,66 @@
+"""
+Tests of the preprocessed-signal cache (cache_data): key invalidation, reloading and
+least-recently-used eviction.
+"""
+import os
+import mne
+import numpy as np
+from modules import cache_data
+
+PARAMS = {'filter_chain': 'mne', 'resample_method': 'fft', 'new_sfreq': 3000, 'notch_freqs': 60,
+          'l_freq': 20, 'h_freq': 500}
+
+def _raw(seed=0, n_times=3000):
+    data = np.random.default_rng(seed).normal(size=(2, n_times))
+    raw = mne.io.RawArray(data, mne.create_info(['EMG1', 'EMG2'], 3000, ch_types='emg'), verbose=False)
+    raw.set_annotations(mne.Annotations([0.1, 0.5], [0, 0], ['Display/D  4', 'Gkg/G  2']))
+    return raw
+
+def test_key_is_stable(game_recording):
+    assert cache_data.signal_cache_key(game_recording, PARAMS) == cache_data.signal_cache_key(game_recording, dict(PARAMS))
+
+def test_key_changes_with_markers_signal_and_params(game_recording):
+    key = cache_data.signal_cache_key(game_recording, PARAMS)
+    assert cache_data.signal_cache_key(game_recording, {**PARAMS, 'resample_method': 'polyphase'}) != key
+    assert cache_data.signal_cache_key(game_recording, {**PARAMS, 'h_freq': 450}) != key
+
+    # A marker edit that leaves the header and the signal untouched
+    marker_file = game_recording.with_suffix('.vmrk')
+    marker_file.write_text(marker_file.read_text().replace('D  5', 'D  6', 1), encoding='utf-8')
+    marker_key = cache_data.signal_cache_key(game_recording, PARAMS)
+    assert marker_key != key
+
+    # A rewritten signal file (same size, new modification time)
+    eeg_file = game_recording.with_suffix('.eeg')
+    stat = eeg_file.stat()
+    os.utime(eeg_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache_data.signal_cache_key(game_recording, PARAMS) != marker_key
+
+def test_miss_then_hit(tmp_path):
+    assert cache_data.load_filtered_raw(tmp_path, 'missing') is None
+
+    raw = _raw()
+    cache_data.save_filtered_raw(raw, tmp_path, 'entry')
+    cached = cache_data.load_filtered_raw(tmp_path, 'entry')
+    np.testing.assert_array_equal(cached.get_data(), raw.get_data())
+    assert cached.info['sfreq'] == raw.info['sfreq'] and cached.ch_names == raw.ch_names
+    np.testing.assert_allclose(cached.annotations.onset, raw.annotations.onset)
+    assert list(cached.annotations.description) == list(raw.annotations.description)
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    entry_size = sum(f.stat().st_size for f in cache_data.save_filtered_raw(_raw(0), tmp_path, 'a').iterdir())
+    cache_data.save_filtered_raw(_raw(1), tmp_path, 'b')
+    # 'a' is older than 'b' but was used last
+    os.utime(tmp_path / 'a', (1000, 1000))
+    os.utime(tmp_path / 'b', (2000, 2000))
+    cache_data.load_filtered_raw(tmp_path, 'a')
+
+    # A budget of two and a half entries, given in GB as cache_size_gb in main_processing
+    cache_size_gb = 2.5 * entry_size / 1024**3
+    cache_data.save_filtered_raw(_raw(2), tmp_path, 'c', max_bytes=int(cache_size_gb * 1024**3))
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ['a', 'c']
+
+def test_new_entry_is_kept_over_budget(tmp_path):
+    cache_data.save_filtered_raw(_raw(0), tmp_path, 'a')
+    cache_data.save_filtered_raw(_raw(1), tmp_path, 'b', max_bytes=0)
+    assert [entry.name for entry in tmp_path.iterdir()] == ['b']
@@ -0,0 +1,53 @@
+"""
+Tests of the context labels (analysis.create_context_column) against a trial-by-trial loop.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from modules import analysis
+
+def _reference_contexts(df, contexts):
+    """Longest context matching the end of each trial's history, walking back trial by trial."""
+    chain = df['stochastic_chain_info'].tolist()
+    keys = list(zip(df['ID_info'], df['block_info']))
+    labels = []
+    for row in range(len(df)):
+        history = ''
+        previous = row - 1
+        while previous >= 0 and keys[previous] == keys[row] and chain[previous] in (0, 1, 2):
+            history = str(int(chain[previous])) + history
+            previous -= 1
+        matches = [context for context in contexts if history.endswith(context)]
+        labels.append(max(matches, key=len) if matches else np.nan)
+    return labels
+
+@pytest.fixture
+def trials():
+    rng = np.random.default_rng(0)
+    chain = rng.choice([0, 1, 2], 600).astype(float)
+    chain[rng.choice(600, 20, replace=False)] = np.nan
+    return pd.DataFrame({
+        'ID_info': np.repeat(['V01', 'V02'], 300),
+        'block_info': np.tile(np.repeat([0, 1, 2], 100), 2),
+        'stochastic_chain_info': chain
+    })
+
+@pytest.mark.parametrize('contexts', [analysis.TREE_CONTEXTS[13], ['0', '2', '01', '11', '21'], ['000', '100', '1', '2']])
+def test_matches_trial_loop(trials, contexts):
+    labels = analysis.create_context_column(trials.copy(), contexts)['context']
+    expected = pd.Series(_reference_contexts(trials, contexts))
+    pd.testing.assert_series_equal(labels.reset_index(drop=True), expected, check_names=False, check_dtype=False)
+
+def test_history_stops_at_blocks_and_volunteers():
+    df = pd.DataFrame({
+        'ID_info': ['V01'] * 5 + ['V02'] * 3,
+        'block_info': [1, 1, 1, 2, 2, 2, 2, 2],
+        'stochastic_chain_info': [2, 0, 1, 0, 1, 1, 2, 0]
+    })
+    labels = analysis.create_context_column(df.copy())['context']
+    assert labels.tolist()[1:3] == ['2', '20'] and labels.tolist()[6:] == ['1', '2']
+    # The first trial of a block and of a volunteer (same block number) has no history
+    assert labels.isna().tolist() == [True, False, False, True, True, True, False, False]
+
+    unbounded = analysis.create_context_column(df.copy(), boundary_columns=())['context']
+    assert unbounded[3] == '1' and unbounded[5] == '1'
@@ -0,0 +1,31 @@
+"""
+Tests of the reduced-precision check of MEP peak-to-peak values (signal_processing.validate_epoch_dtype).
+"""
+import numpy as np
+import pytest
+from modules import signal_processing
+
+def _epochs(seed=0):
+    """Float64 epochs (10 events, 2 channels) with the event at sample 1500 of 1680, in volts."""
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 1e-5, (10, 2, 1680))
+
+def test_checks_the_configured_mep_window():
+    epochs = _epochs()
+    reduced = epochs.astype(np.float32)
+    # A float32-only error between the stimulus and a 15 ms delay: seen with the default 
+    # 10 ms delay (window from the stimulus), outside a 25 ms delay (window from 15 ms)
+    reduced[:, :, 1500:1530] = epochs[:, :, 1500:1530].max() * 2
+    with pytest.raises(ValueError):
+        signal_processing.validate_epoch_dtype(reduced, epochs, 30, 1500, delay_ms=10, sfreq=3000)
+    assert signal_processing.validate_epoch_dtype(reduced, epochs, 30, 1500, delay_ms=25, sfreq=3000) < 1e-6
+
+def test_flat_channels_and_nan():
+    epochs = _epochs()
+    epochs[:, 1] = 0
+    assert signal_processing.validate_epoch_dtype(epochs.astype(np.float32), epochs, 30, 1500) < 1e-6
+
+    reduced = epochs.astype(np.float32)
+    reduced[0, 0, 1600] = np.nan
+    with pytest.raises(ValueError):
+        signal_processing.validate_epoch_dtype(reduced, epochs, 30, 1500)
@@ -0,0 +1,81 @@
+"""
+Tests of event-local filtering (signal_processing.filter_event_segments) on synthetic
+5 kHz recordings, against filtering the whole recording.
+"""
+import mne
+import numpy as np
+import pytest
+from modules import signal_processing
+
+SFREQ = 5000
+NEW_SFREQ = 3000
+
+def _synthetic_recording(mep_amplitude, seed=0, duration=60):
+    """Noise plus 60 Hz line noise (n_times, 2), with MEPs of mep_amplitude volts every 1.6 s."""
+    rng = np.random.default_rng(seed)
+    times = np.arange(duration * SFREQ) / SFREQ
+    data = rng.normal(0, 20e-6, (len(times), 2)) + 200e-6 * np.sin(2 * np.pi * 60 * times + 1)[:, np.newaxis]
+    events_native = np.arange(3 * SFREQ, len(times) - 3 * SFREQ, int(1.6 * SFREQ))
+    for event in events_native:
+        data[event + 50:event + 200] += mep_amplitude * np.sin(np.linspace(0, 3 * np.pi, 150))[:, np.newaxis]
+    return data, np.round(events_native * NEW_SFREQ / SFREQ).astype(int)
+
+@pytest.mark.parametrize('mep_amplitude', [0, 800e-6])
+def test_padding_on_noise_and_mep_dominated_data(mep_amplitude):
+    data, events = _synthetic_recording(mep_amplitude)
+    error = signal_processing.validate_event_padding(data, SFREQ, events, 1500, 180, rtol=1e-3)
+    assert error < 1e-3
+
+def test_matches_full_chain_without_line_noise():
+    data, events = _synthetic_recording(0)
+    local = signal_processing.filter_event_segments(data, SFREQ, events, 1500, 180, notch_freqs=None)
+
+    raw = mne.io.RawArray(data.T.copy(), mne.create_info(2, SFREQ, ch_types='eeg'), verbose=False)
+    full = signal_processing.preprocess_raw(raw, NEW_SFREQ, notch_freqs=None).get_data()
+    reference = full[:, events[:, np.newaxis] + np.arange(-1500, 180)].transpose(1, 0, 2)
+    np.testing.assert_allclose(local, reference, atol=1e-3 * np.abs(reference).max())
+
+def test_short_padding_is_detected():
+    data, events = _synthetic_recording(0)
+    with pytest.raises(ValueError, match='pad_samples'):
+        signal_processing.validate_event_padding(data, SFREQ, events, 1500, 180, pad_samples=5, rtol=1e-3)
+
+def test_blanking_at_native_stimulus_samples():
+    data, events = _synthetic_recording(800e-6)
+    stimuli = events * SFREQ // NEW_SFREQ
+    for stimulus in stimuli:
+        data[stimulus:stimulus + 10] += 5e-3
+    local = signal_processing.filter_event_segments(data, SFREQ, events, 1500, 180, notch_freqs=None, 
+                                                    blank_ms=(1, 5), stimulus_samples=stimuli)
+
+    blanked = signal_processing.blank_stimulus_artifact(data.T.copy(), stimuli, 5, 25)
+    raw = mne.io.RawArray(blanked, mne.create_info(2, SFREQ, ch_types='eeg'), verbose=False)
+    full = signal_processing.preprocess_raw(raw, NEW_SFREQ, notch_freqs=None).get_data()
+    reference = full[:, events[:, np.newaxis] + np.arange(-1500, 180)].transpose(1, 0, 2)
+    np.testing.assert_allclose(local, reference, atol=1e-3 * np.abs(reference).max())
+
+def test_blanking_requires_stimulus_samples():
+    data, events = _synthetic_recording(0)
+    with pytest.raises(ValueError, match='stimulus_samples'):
+        signal_processing.filter_event_segments(data, SFREQ, events, 1500, 180, blank_ms=(1, 5))
+
+def test_blanking_window_must_fit_inside_the_segment():
+    # At 1 kHz, (2, 25) ms blank 2 samples before and 25 from each stimulus; segments of 100 samples
+    segments = np.random.default_rng(0).normal(size=(2, 1, 100))
+    original = segments.copy()
+    signal_processing._blank_segments(segments, [75, 174], [0, 100], (2, 25), 1000)
+
+    # The window of stimulus 75 would end on the last sample of segment 0 and is left alone
+    np.testing.assert_array_equal(segments[0], original[0])
+    # That of stimulus 174 (segment sample 74) ends one sample before the end and is blanked
+    np.testing.assert_allclose(segments[1, 0, 72:99], np.linspace(original[1, 0, 71], original[1, 0, 99], 29)[1:-1])
+
+def test_full_mode_check_sees_the_chain_differences():
+    data, events = _synthetic_recording(800e-6)
+    # Without line noise removal and with the same resampling, only the padding differs
+    error = signal_processing.validate_event_local(data, SFREQ, events, 1500, 180, rtol=1e-3, notch_freqs=None, 
+                                                   resample_method='polyphase')
+    assert error < 1e-3
+    # The line noise fit and the FFT resampling of the full mode are not reproduced
+    with pytest.raises(ValueError, match='full-mode chain'):
+        signal_processing.validate_event_local(data, SFREQ, events, 1500, 180, rtol=0.01)
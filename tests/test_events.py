@@ -0,0 +1,63 @@
+"""
+Tests of the marker events: reading them from the '.vmrk' file (import_signal) and the
+structured event table (utils), against MNE's annotations.
+"""
+import mne
+import numpy as np
+from modules import import_signal
+from modules import signal_processing
+from modules import utils
+
+ALFABET = {'Gkg/G  2': 0, 'Gkg/G  4': 1, 'Gkg/G  8': 2}
+
+def _mne_events(vhdr, sfreq=None):
+    """Events of the recording as the full-mode pipeline got them, from a (resampled) RawArray."""
+    raw = mne.io.read_raw_brainvision(vhdr, preload=True, verbose=False)
+    if sfreq is not None:
+        raw.resample(sfreq, verbose=False)
+    raw_array = mne.io.RawArray(raw.get_data(), raw.info, verbose=False)
+    raw_array.set_annotations(raw.annotations)
+    return mne.events_from_annotations(raw_array, verbose=False)
+
+def test_marker_events_match_mne(game_recording):
+    for sfreq in [None, 3000]:
+        events, event_dict = import_signal.import_brainvision_events(game_recording, sfreq=sfreq)
+        expected_events, expected_dict = _mne_events(game_recording, sfreq)
+        np.testing.assert_array_equal(events, expected_events)
+        assert event_dict == expected_dict
+
+def test_event_table_partition(game_recording):
+    events, event_dict = import_signal.import_brainvision_events(game_recording, sfreq=3000)
+    table = utils.set_event_alfabet(utils.create_event_table(events[:, 0], events[:, 2]), event_dict, ALFABET)
+    parts = utils.partition_events_by_code(table)
+
+    for code in np.unique(events[:, 2]):
+        np.testing.assert_array_equal(parts[code]['sample'], events[events[:, 2] == code, 0])
+    gkg_codes = [event_dict[name] for name in ALFABET]
+    gkg = utils.select_events(parts, gkg_codes)
+    np.testing.assert_array_equal(gkg['sample'], events[np.isin(events[:, 2], gkg_codes), 0])
+    names = {code: name for name, code in event_dict.items()}
+    assert gkg['alfabet'].tolist() == [ALFABET[names[code]] for code in gkg['code']]
+    assert set(table['alfabet'][~np.isin(table['code'], gkg_codes)]) == {-1}
+
+def test_rest_pulses_are_split_from_the_game(game_recording):
+    events, event_dict = import_signal.import_brainvision_events(game_recording, sfreq=3000)
+    table = utils.create_event_table(events[:, 0], events[:, 2])
+    d4 = event_dict['Display/D  4']
+    out_game, in_game = signal_processing.split_events_InOut_game(table[np.argmax(table['code'] == d4):])
+    assert len(out_game) == 4 and set(out_game['code']) == {d4}
+    assert np.sum(in_game['code'] == d4) == 12
+
+def test_response_times_of_the_recording(game_recording):
+    events, event_dict = import_signal.import_brainvision_events(game_recording, sfreq=3000)
+    table = utils.set_event_alfabet(utils.create_event_table(events[:, 0], events[:, 2]), event_dict, ALFABET)
+    parts = utils.partition_events_by_code(table)
+    events_Gkg = utils.select_events(parts, [event_dict[name] for name in ALFABET])
+    response_times, sequence, choice = signal_processing.calculate_response_times(
+        parts[event_dict['Display/D  2']], events_Gkg, 3000)
+
+    assert len(response_times) == 12
+    assert np.all((response_times[:11] > 0.39) & (response_times[:11] < 0.43))
+    assert np.isnan(response_times[11]) and np.isnan(sequence[11]) and np.isnan(choice[11])
+    np.testing.assert_array_equal(sequence[:11], events_Gkg['alfabet'][0::2])
+    np.testing.assert_array_equal(choice[:11], events_Gkg['alfabet'][1::2])
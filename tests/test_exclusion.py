@@ -0,0 +1,77 @@
+"""
+Tests of the grouped outlier exclusion (signal_processing.exclude_outliers and the RMS
+window sweep) against a per-group numpy loop.
+"""
+import numpy as np
+import pytest
+from modules import signal_processing
+
+def _reference_bounds(column, rule):
+    """Bounds of one group and column computed directly with numpy."""
+    column = column[~np.isnan(column)]
+    if rule == 'rms_sd':
+        return -np.inf, column.mean() + 2 * column.std()
+    if rule == 'iqr':
+        q1, q3 = np.percentile(column, [25, 75])
+        return q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    median = np.median(column)
+    mad = 1.4826 * np.median(np.abs(column - median))
+    return median - 3.5 * mad, median + 3.5 * mad
+
+def _reference_mask(values, rule, codes, reference):
+    mask = np.zeros(values.shape, dtype=bool)
+    for code in np.unique(codes):
+        rows = (codes == code) & reference
+        for column in range(values.shape[1]):
+            lower, upper = _reference_bounds(values[rows, column], rule)
+            mask[rows, column] = (values[rows, column] < lower) | (values[rows, column] > upper)
+    return mask
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(0, 0.5, (300, 2))
+    values[rng.choice(300, 15, replace=False), 0] *= 8
+    values[rng.choice(300, 10, replace=False), 1] = np.nan
+    return values
+
+@pytest.mark.parametrize('rule', ['rms_sd', 'iqr', 'mad'])
+def test_rules_match_numpy(values, rule):
+    blocks = np.repeat(np.arange(6), 50)
+    result = signal_processing.exclude_outliers(values, rule, groups=blocks)
+    np.testing.assert_array_equal(result['mask'], _reference_mask(values, rule, blocks, np.ones(300, dtype=bool)))
+    assert result['mask'][:, 0].any()
+    assert not result['mask'][np.isnan(values)].any()
+
+@pytest.mark.parametrize('rule', ['rms_sd', 'iqr', 'mad'])
+def test_combined_groups_and_reference(values, rule):
+    volunteers = np.repeat(['V01', 'V02'], 150)
+    blocks = np.tile(np.repeat(np.arange(3), 50), 2)
+    reference = np.tile(np.arange(50) % 5 != 0, 6)
+    result = signal_processing.exclude_outliers(values, rule, groups=[volunteers, blocks], reference=reference)
+
+    codes = np.unique(np.char.add(volunteers, blocks.astype(str)), return_inverse=True)[1]
+    np.testing.assert_array_equal(result['mask'], _reference_mask(values, rule, codes, reference))
+    assert len(result['groups']) == 6
+    assert not result['mask'][~reference].any()
+
+def test_single_group_and_custom_multiplier(values):
+    result = signal_processing.exclude_outliers(values[:, 0], 'rms_sd', k=3)
+    column = values[:, 0]
+    np.testing.assert_array_equal(result['mask'], column > column.mean() + 3 * column.std())
+    assert result['upper'].shape == (1, 1)
+
+def test_rms_sweep_uses_the_exclusion_groups():
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=(2, 20000)) * np.repeat([1, 3], 10000)
+    rms_index = signal_processing.build_rms_index(data, [0, 1])
+    events = np.arange(1000, 20000, 100)
+    blocks = (events >= 10000).astype(int)
+
+    fractions = signal_processing.rms_exclusion_sweep(rms_index, events, [200, 500], 1.5, groups=blocks)
+    for length, fraction in zip([200, 500], fractions):
+        rms = signal_processing.window_rms(rms_index, events, -length)
+        expected = signal_processing.exclude_outliers(rms, 'rms_sd', groups=blocks, k=1.5)['mask'].mean(axis=0)
+        np.testing.assert_array_equal(fraction, expected)
+    # Session-wide thresholds would exclude the noisier second half instead
+    assert not np.array_equal(fractions, signal_processing.rms_exclusion_sweep(rms_index, events, [200, 500], 1.5))
@@ -0,0 +1,29 @@
+"""
+Tests of the filter design registry and its '.npz' persistence (save_filter_designs and
+load_filter_designs).
+"""
+import mne
+import numpy as np
+from modules import signal_processing
+
+def test_designs_survive_a_save_and_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(signal_processing, '_filter_designs', {})
+    bandpass = signal_processing.get_filter_design(3000, 20, 500)
+    notch = signal_processing.get_notch_design(3000, [60, 120])
+    designs = dict(signal_processing._filter_designs)
+    assert signal_processing.save_filter_designs(tmp_path / 'filter_designs.npz') == 2
+
+    monkeypatch.setattr(signal_processing, '_filter_designs', {})
+    assert signal_processing.load_filter_designs(tmp_path / 'filter_designs.npz') == 2
+    assert set(signal_processing._filter_designs) == set(designs)
+    assert signal_processing.notch_design_key(3000, [60, 120]) in signal_processing._filter_designs
+
+    # Loaded designs are found by their keys, without designing them again
+    def no_design(*args, **kwargs):
+        raise AssertionError('design was not reloaded')
+    monkeypatch.setattr(mne.filter, 'create_filter', no_design)
+    reloaded_bandpass = signal_processing.get_filter_design(3000, 20, 500)
+    reloaded_notch = signal_processing.get_notch_design(3000, [60, 120])
+    np.testing.assert_array_equal(reloaded_bandpass['sos'], bandpass['sos'])
+    np.testing.assert_array_equal(reloaded_notch['fir'], notch['fir'])
+    assert reloaded_bandpass['padlen'] == bandpass['padlen'] and reloaded_notch['padlen'] == notch['padlen']
@@ -0,0 +1,64 @@
+"""
+Tests of the response time and choice matching (signal_processing.calculate_response_times),
+including D2 events without following Gkg events, and of how missing choices are exported.
+"""
+import io
+import numpy as np
+import pandas as pd
+from modules import analysis
+from modules import export_data
+from modules import signal_processing
+from modules import utils
+
+def _gkg_events(samples, alfabet):
+    events = utils.create_event_table(samples, np.full(len(samples), 6))
+    events['alfabet'] = alfabet
+    return events
+
+def _loop_reference(d2_samples, gkg_samples, gkg_alfabet, sfreq):
+    """Per-D2 scan of the following Gkg events, as the pipeline did before vectorizing."""
+    response_times, Gx1, Gx2 = [], [], []
+    for sample in d2_samples:
+        following = np.flatnonzero(gkg_samples > sample)
+        response_times.append((gkg_samples[following[0]] - sample) / sfreq if len(following) else np.nan)
+        Gx1.append(gkg_alfabet[following[0]] if len(following) else np.nan)
+        Gx2.append(gkg_alfabet[following[1]] if len(following) > 1 else np.nan)
+    return np.array(response_times), np.array(Gx1, dtype=float), np.array(Gx2, dtype=float)
+
+def test_missing_following_events_are_nan():
+    events_D2 = utils.create_event_table([100, 300, 500], [2, 2, 2])
+    events_Gkg = _gkg_events([150, 200, 350], [0, 2, 1])
+    response_times, Gx1, Gx2 = signal_processing.calculate_response_times(events_D2, events_Gkg, 1000)
+
+    np.testing.assert_array_equal(response_times, [0.05, 0.05, np.nan])
+    np.testing.assert_array_equal(Gx1, [0, 1, np.nan])
+    np.testing.assert_array_equal(Gx2, [2, np.nan, np.nan])
+
+def test_matches_loop_reference():
+    rng = np.random.default_rng(0)
+    d2_samples = np.sort(rng.choice(100000, 300, replace=False))
+    gkg_samples = np.sort(rng.choice(100000, 500, replace=False))
+    gkg_alfabet = rng.integers(0, 3, 500)
+
+    result = signal_processing.calculate_response_times(
+        utils.create_event_table(d2_samples, np.full(300, 2)), _gkg_events(gkg_samples, gkg_alfabet), 3000)
+    for values, expected in zip(result, _loop_reference(d2_samples, gkg_samples, gkg_alfabet, 3000)):
+        np.testing.assert_array_equal(values, expected)
+
+def test_missing_choices_are_never_correct():
+    choice = np.array([0, 1, np.nan, np.nan])
+    sequence = np.array([0, 2, 1, np.nan])
+    assert signal_processing.analyze_choice(choice, sequence) == ['correct', 'incorrect', 'incorrect', 'incorrect']
+
+    df = pd.DataFrame({'ID_info': 1, 'block_info': 1, 'response_info': choice, 'stochastic_chain_info': sequence})
+    cube = analysis.build_success_rate_cube(df, by=('ID_info', 'block_info'))
+    assert cube['n_trials'].tolist() == [4] and cube['n_correct'].tolist() == [1]
+
+def test_missing_choices_are_exported_blank():
+    variables = utils.fill_missing_with_symbolic_value({
+        'response_time_info': np.array([0.5, np.nan]),
+        'response_info': export_data.nullable_integer_column(np.array([2, np.nan]))
+    })
+    csv = io.StringIO()
+    export_data.create_df_from_dict(variables).to_csv(csv, index=False)
+    assert csv.getvalue().splitlines() == ['response_time_info,response_info', '0.5,2', '99999.0,']